@@ -1,31 +1,105 @@
-
-
+import time
+RERUN_STARTED = time.perf_counter()
 
 import os
+import sys
 import streamlit as st
-import google.generativeai as genai
 from dotenv import load_dotenv
 import datetime
-import pandas as pd
-import plotly.express as px
-from supabase import create_client, Client
-import matplotlib.pyplot as plt
-import numpy as np
-from PIL import Image
-import requests
-from io import BytesIO
+import atexit
+from io import BytesIO, TextIOWrapper
 import hashlib
+import hmac
+import importlib
+import csv
+import difflib
+from bisect import bisect_left
+import json
+import math
+import re
+import logging
+import sqlite3
+import threading
+import uuid
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+# Gemini, Supabase, Pillow and Plotly are imported on first use so the login page
+# does not pay for them
 
 load_dotenv()
 
+logger = logging.getLogger("wellher")
+
 # Load environment variables
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
-model = genai.GenerativeModel('gemini-2.5-pro')
+GEMINI_MODEL = os.getenv("GEMINI_MODEL", "gemini-2.5-pro")
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", 60))
+GEMINI_MAX_ATTEMPTS = int(os.getenv("GEMINI_MAX_ATTEMPTS", 3))
+GEMINI_RETRY_BACKOFF = float(os.getenv("GEMINI_RETRY_BACKOFF", 1.0))
+WRITE_BATCH_SIZE = int(os.getenv("WRITE_BATCH_SIZE", 50))
+WRITE_FLUSH_INTERVAL = float(os.getenv("WRITE_FLUSH_INTERVAL", 2.0))
+WRITE_MAX_BULK = int(os.getenv("WRITE_MAX_BULK", 500))
+WRITE_MAX_ATTEMPTS = int(os.getenv("WRITE_MAX_ATTEMPTS", 20))
+WRITE_RETRY_MAX_BACKOFF = float(os.getenv("WRITE_RETRY_MAX_BACKOFF", 300))
+READ_CACHE_TTL = float(os.getenv("READ_CACHE_TTL", 300))
+READ_CACHE_MAX_BYTES = int(os.getenv("READ_CACHE_MAX_BYTES", 64 * 1024 * 1024))
+ROLLUP_TTL = float(os.getenv("ROLLUP_TTL", 1800))
+ROLLUP_MAX_STATES = int(os.getenv("ROLLUP_MAX_STATES", 4096))
+SYNC_PAGE_SIZE = int(os.getenv("SYNC_PAGE_SIZE", 1000))
+TRANSFER_CHUNK_ROWS = int(os.getenv("TRANSFER_CHUNK_ROWS", 5000))
+CHART_MAX_POINTS = int(os.getenv("CHART_MAX_POINTS", 400))
+CHART_CACHE_ENTRIES = int(os.getenv("CHART_CACHE_ENTRIES", 8))
+HEALTH_CONTEXT_TOKEN_BUDGET = int(os.getenv("HEALTH_CONTEXT_TOKEN_BUDGET", 600))
+AI_MAX_WORKERS = int(os.getenv("AI_MAX_WORKERS", 8))
+AI_JOBS_PER_USER = int(os.getenv("AI_JOBS_PER_USER", 2))
+# A photo batch may run more jobs than AI_JOBS_PER_USER, but leaves the other workers to other users
+AI_BATCH_PER_USER = int(os.getenv("AI_BATCH_PER_USER", 4))
+AI_JOB_RESULT_TTL = float(os.getenv("AI_JOB_RESULT_TTL", 600))
+AI_JOB_POLL_INTERVAL = float(os.getenv("AI_JOB_POLL_INTERVAL", 0.5))
+AUTH_KDF_ITERATIONS = int(os.getenv("AUTH_KDF_ITERATIONS", 600_000))
+AUTH_MAX_FAILURES = int(os.getenv("AUTH_MAX_FAILURES", 5))
+AUTH_FAILURE_WINDOW = float(os.getenv("AUTH_FAILURE_WINDOW", 300))
+AUTH_MAX_TRACKED_USERNAMES = int(os.getenv("AUTH_MAX_TRACKED_USERNAMES", 10000))
+AUTH_MAX_CONCURRENT_HASHES = int(os.getenv("AUTH_MAX_CONCURRENT_HASHES", 4))
+AUTH_HASH_WAIT = float(os.getenv("AUTH_HASH_WAIT", 10))
+SHOW_TIMINGS = os.getenv("WELLHER_SHOW_TIMINGS") == "1"
+METRICS_EVENT_CAPACITY = int(os.getenv("METRICS_EVENT_CAPACITY", 2000))
+SUPABASE_FACTORY = os.getenv("WELLHER_SUPABASE_FACTORY")
+MODEL_FACTORY = os.getenv("WELLHER_MODEL_FACTORY")
+ADMIN_USERS = {name.strip() for name in os.getenv("WELLHER_ADMIN_USERS", "").split(",") if name.strip()}
+LOCAL_DB_PATH = os.getenv("WELLHER_LOCAL_DB", "wellher_local.db")
+LOCAL_SYNC_INTERVAL = float(os.getenv("LOCAL_SYNC_INTERVAL", 30))
+LOCAL_SYNC_IDLE = float(os.getenv("LOCAL_SYNC_IDLE", 900))
+LOCAL_SYNC_ID_OVERLAP = int(os.getenv("LOCAL_SYNC_ID_OVERLAP", 100))
+ANALYSIS_CACHE_TTL = int(os.getenv("ANALYSIS_CACHE_TTL", 7 * 24 * 3600))
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", 2000))
+IMAGE_MAX_SIDE = int(os.getenv("IMAGE_MAX_SIDE", 1024))
+IMAGE_FORMAT = os.getenv("IMAGE_FORMAT", "JPEG").upper()
+IMAGE_QUALITY = int(os.getenv("IMAGE_QUALITY", 85))
+ADVICE_CACHE_TTL = int(os.getenv("ADVICE_CACHE_TTL", 30 * 24 * 3600))
+ADVICE_CACHE_MAX_ENTRIES = int(os.getenv("ADVICE_CACHE_MAX_ENTRIES", 5000))
+ADVICE_CALORIE_BUCKET = int(os.getenv("ADVICE_CALORIE_BUCKET", 250))
+NUTRITION_TABLE_PATH = os.getenv("NUTRITION_TABLE_PATH", "nutrition_foods.csv")
+NUTRITION_MIN_SAMPLES = int(os.getenv("NUTRITION_MIN_SAMPLES", 3))
+
+# Columns each table's pages need; tables not listed are synced in full. ``id`` is the
+# server-assigned identity pulls are keyed on
+SYNC_COLUMNS = {
+    'food_logs': 'id,logged_at,time,food,calories',
+    'health_logs': 'id,logged_at,date,blood_pressure,sugar_level,cholesterol'
+}
 
-# Initialize Supabase
-supabase_url = os.getenv("SUPABASE_URL")
-supabase_key = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(supabase_url, supabase_key)
+# Column types for bulk import and export, in file column order
+TRANSFER_COLUMNS = {
+    'food_logs': {'logged_at': 'timestamp', 'time': 'text', 'food': 'text', 'calories': 'number'},
+    'health_logs': {
+        'logged_at': 'timestamp', 'date': 'text',
+        'blood_pressure': 'number', 'sugar_level': 'number', 'cholesterol': 'number'
+    }
+}
+# Display columns filled in from logged_at when an imported file leaves them out
+TRANSFER_DERIVED = {'time': '%H:%M', 'date': '%Y-%m-%d %H:%M'}
 
 st.set_page_config(
     page_title="WellHer - Women's Health Companion",
@@ -34,34 +108,324 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
-def load_css(file_name):
+# Shared Resources
+@st.cache_resource
+def get_startup_timings():
+    """Process-wide durations of each startup stage in seconds: ``first`` keeps the cold
+    start of the process, ``latest`` is overwritten by every later run of the stage."""
+    return {'first': {}, 'latest': {}}
+
+def record_timing(stage, started, level=logging.INFO):
+    elapsed = time.perf_counter() - started
+    timings = get_startup_timings()
+    timings['first'].setdefault(stage, elapsed)
+    timings['latest'][stage] = elapsed
+    logger.log(level, "%s took %.1f ms", stage, elapsed * 1000)
+
+def startup_report():
+    timings = get_startup_timings()
+    return " · ".join(
+        f"{stage} {timings['first'][stage] * 1000:.0f} ms cold, {elapsed * 1000:.0f} ms latest"
+        for stage, elapsed in timings['latest'].items()
+    )
+
+record_timing('imports', RERUN_STARTED, logging.DEBUG)
+
+class Metrics:
+    """In-process call metrics per site: latency histogram, errors, payload bytes and tokens.
+
+    Recording is a handful of counter updates under a lock. The latest events are kept
+    in a ring buffer for the admin page, and ``prometheus`` renders the text format.
+    """
+
+    LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+    def __init__(self, event_capacity):
+        self._sites = {}
+        self._events = deque(maxlen=event_capacity)
+        self._lock = threading.Lock()
+
+    def observe(self, site, elapsed, error=False, size=0, tokens=0):
+        index = bisect_left(self.LATENCY_BUCKETS, elapsed)
+        with self._lock:
+            stats = self._sites.get(site)
+            if stats is None:
+                stats = self._sites[site] = {
+                    'count': 0, 'errors': 0, 'seconds': 0.0, 'bytes': 0, 'tokens': 0,
+                    'buckets': [0] * (len(self.LATENCY_BUCKETS) + 1)
+                }
+            stats['count'] += 1
+            stats['errors'] += error
+            stats['seconds'] += elapsed
+            stats['bytes'] += size
+            stats['tokens'] += tokens
+            stats['buckets'][index] += 1
+            self._events.append((time.time(), site, elapsed, error, size, tokens))
+
+    def _quantile(self, buckets, count, q):
+        """Upper bound of the bucket holding the q-th quantile."""
+        seen = 0
+        for bound, n in zip(self.LATENCY_BUCKETS + (float('inf'),), buckets):
+            seen += n
+            if seen >= q * count:
+                return bound
+        return float('inf')
+
+    def summary(self):
+        with self._lock:
+            sites = {site: dict(stats, buckets=list(stats['buckets'])) for site, stats in self._sites.items()}
+        return [
+            {
+                'site': site,
+                'calls': stats['count'],
+                'error_rate': stats['errors'] / stats['count'],
+                'mean_ms': stats['seconds'] / stats['count'] * 1000,
+                'p50_ms': self._quantile(stats['buckets'], stats['count'], 0.5) * 1000,
+                'p95_ms': self._quantile(stats['buckets'], stats['count'], 0.95) * 1000,
+                'p99_ms': self._quantile(stats['buckets'], stats['count'], 0.99) * 1000,
+                'bytes': stats['bytes'],
+                'tokens': stats['tokens']
+            }
+            for site, stats in sorted(sites.items())
+        ]
+
+    def events(self):
+        with self._lock:
+            return list(self._events)
+
+    def prometheus(self):
+        with self._lock:
+            sites = {site: dict(stats, buckets=list(stats['buckets'])) for site, stats in self._sites.items()}
+        lines = [
+            "# HELP wellher_call_duration_seconds Latency of instrumented calls.",
+            "# TYPE wellher_call_duration_seconds histogram"
+        ]
+        for site, stats in sorted(sites.items()):
+            cumulative = 0
+            for bound, n in zip(self.LATENCY_BUCKETS + (float('inf'),), stats['buckets']):
+                cumulative += n
+                le = "+Inf" if bound == float('inf') else f"{bound:g}"
+                lines.append(f'wellher_call_duration_seconds_bucket{{site="{site}",le="{le}"}} {cumulative}')
+            lines.append(f'wellher_call_duration_seconds_sum{{site="{site}"}} {stats["seconds"]:.6f}')
+            lines.append(f'wellher_call_duration_seconds_count{{site="{site}"}} {stats["count"]}')
+        for name, key, help_text in (
+            ("wellher_call_errors_total", 'errors', "Instrumented calls that raised."),
+            ("wellher_call_payload_bytes_total", 'bytes', "Payload bytes sent or received."),
+            ("wellher_call_tokens_total", 'tokens', "Gemini tokens used.")
+        ):
+            lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+            lines += [f'{name}{{site="{site}"}} {stats[key]}' for site, stats in sorted(sites.items())]
+        return "\n".join(lines) + "\n"
+
+@st.cache_resource
+def get_metrics():
+    return Metrics(METRICS_EVENT_CAPACITY)
+
+@contextmanager
+def track(site, metrics=None):
+    """Time the enclosed call; set ``size`` and ``tokens`` on the yielded dict to record them.
+
+    Exceptions are counted as errors and re-raised. A stream abandoned mid-way
+    (GeneratorExit) is not recorded. Background threads pass ``metrics`` explicitly,
+    since they have no script context to resolve ``get_metrics`` in.
+    """
+    metrics = metrics or get_metrics()
+    call = {'size': 0, 'tokens': 0}
+    started = time.perf_counter()
+    try:
+        yield call
+    except Exception:
+        metrics.observe(site, time.perf_counter() - started, error=True)
+        raise
+    metrics.observe(site, time.perf_counter() - started, size=call['size'], tokens=call['tokens'])
+
+def payload_size(value):
+    return len(json.dumps(value, default=str))
+
+def usage_tokens(response):
+    usage = getattr(response, 'usage_metadata', None)
+    return getattr(usage, 'total_token_count', 0) or 0
+
+def load_factory(spec):
+    module_name, _, attr = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attr)
+
+@st.cache_resource
+def get_supabase():
+    """Create the Supabase client once per process; sessions share its connection pool.
+
+    ``WELLHER_SUPABASE_FACTORY`` (``module:callable``) substitutes another client,
+    such as the benchmark's local stand-in.
+    """
+    started = time.perf_counter()
+    if SUPABASE_FACTORY:
+        client = load_factory(SUPABASE_FACTORY)()
+    else:
+        from supabase import create_client
+        client = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+    record_timing('supabase_client', started)
+    return client
+
+@st.cache_resource
+def get_model():
+    """Configure Gemini and build the shared model on first use.
+
+    ``WELLHER_MODEL_FACTORY`` (``module:callable``) substitutes another model; it is
+    called with the model name.
+    """
+    started = time.perf_counter()
+    if MODEL_FACTORY:
+        model = load_factory(MODEL_FACTORY)(GEMINI_MODEL)
+    else:
+        import google.generativeai as genai
+        genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+        model = genai.GenerativeModel(GEMINI_MODEL)
+    record_timing('gemini_model', started)
+    return model
+
+@st.cache_data
+def read_css(file_name):
     with open(file_name) as f:
-        st.markdown(f"<style>{f.read()}</style>", unsafe_allow_html=True)
+        return f.read()
+
+def load_css(file_name):
+    st.markdown(f"<style>{read_css(file_name)}</style>", unsafe_allow_html=True)
 
 load_css("style.css")
 
 # Authentication Functions
-def hash_password(password):
-    return hashlib.sha256(password.encode()).hexdigest()
+PASSWORD_SCHEME = "pbkdf2_sha256"
 
-def create_user(username, password):
-    hashed_pw = hash_password(password)
-    try:
-        response = supabase.table('users').insert({
+def hash_password(password, salt=None, iterations=AUTH_KDF_ITERATIONS):
+    """Salted PBKDF2-SHA256 hash stored as ``pbkdf2_sha256$<iterations>$<salt>$<digest>``."""
+    salt = salt or os.urandom(16).hex()
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), bytes.fromhex(salt), iterations).hex()
+    return f"{PASSWORD_SCHEME}${iterations}${salt}${digest}"
+
+def check_password(password, stored):
+    """Compare a password with a stored hash, accepting legacy unsalted SHA-256 digests."""
+    if stored.startswith(PASSWORD_SCHEME + "$"):
+        _, iterations, salt, _ = stored.split("$")
+        candidate = hash_password(password, salt, int(iterations))
+    else:
+        candidate = hashlib.sha256(password.encode()).hexdigest()
+    return hmac.compare_digest(candidate, stored)
+
+def needs_rehash(stored):
+    return stored.split("$")[:2] != [PASSWORD_SCHEME, str(AUTH_KDF_ITERATIONS)]
+
+class AuthService:
+    """Username/password checks against the users table.
+
+    Each login reads only ``password_hash`` for one username, and usernames with too
+    many recent failures are refused before any query or hashing. Key derivation runs
+    on the session's own script thread; PBKDF2 releases the GIL, so concurrent logins
+    hash in parallel, but at most ``max_hashes`` at once. Logins past that wait up to
+    ``hash_wait`` seconds and then fail, so a burst of guesses cannot tie up every
+    worker. Unknown usernames are checked against a dummy hash, so they take as long
+    as a wrong password. Failures are tracked for the ``max_tracked`` most recently
+    failed usernames.
+    """
+
+    def __init__(self, client, max_failures, failure_window, max_tracked, max_hashes, hash_wait):
+        self.client = client
+        self.max_failures = max_failures
+        self.failure_window = failure_window
+        self.max_tracked = max_tracked
+        self.hash_wait = hash_wait
+        self._failures = OrderedDict()
+        self._hashing = threading.BoundedSemaphore(max_hashes)
+        self._dummy_hash = hash_password(os.urandom(16).hex())
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _hash_slot(self):
+        if not self._hashing.acquire(timeout=self.hash_wait):
+            raise TimeoutError("too many logins in progress, please try again in a moment")
+        try:
+            yield
+        finally:
+            self._hashing.release()
+
+    def limited(self, username):
+        """True while ``username`` has used up its failed attempts for the current window."""
+        now = time.monotonic()
+        with self._lock:
+            recent = [t for t in self._failures.get(username, []) if now - t < self.failure_window]
+            if recent:
+                self._failures[username] = recent
+            else:
+                self._failures.pop(username, None)
+            return len(recent) >= self.max_failures
+
+    def _fail(self, username):
+        now = time.monotonic()
+        with self._lock:
+            self._failures.setdefault(username, []).append(now)
+            self._failures.move_to_end(username)
+            # A spray across many usernames forgets the longest-idle ones first
+            while len(self._failures) > self.max_tracked:
+                self._failures.popitem(last=False)
+
+    def _lookup(self, username):
+        """Stored hash for ``username``, or None if there is no such user."""
+        rows = self.client.table('users').select('password_hash').eq('username', username).limit(1).execute().data
+        return rows[0]['password_hash'] if rows else None
+
+    def verify(self, username, password):
+        if self.limited(username):
+            return False
+        stored = self._lookup(username)
+        # Hash even for unknown usernames so response time does not reveal which exist
+        with self._hash_slot():
+            matched = check_password(password, stored or self._dummy_hash) and stored is not None
+        if not matched:
+            self._fail(username)
+            return False
+        with self._lock:
+            self._failures.pop(username, None)
+        if needs_rehash(stored):
+            # Move legacy and outdated hashes to the current KDF settings
+            try:
+                with self._hash_slot():
+                    password_hash = hash_password(password)
+                self.client.table('users').update(
+                    {'password_hash': password_hash}
+                ).eq('username', username).execute()
+            except Exception as e:
+                logger.warning("Rehashing password for %s failed: %s", username, e)
+        return True
+
+    def create(self, username, password):
+        """Insert a new user; returns False if the username is already taken."""
+        if self._lookup(username) is not None:
+            return False
+        with self._hash_slot():
+            password_hash = hash_password(password)
+        self.client.table('users').insert({
             'username': username,
-            'password_hash': hashed_pw,
+            'password_hash': password_hash,
             'created_at': str(datetime.datetime.now())
         }).execute()
-        return True if not response.error else False
+        return True
+
+@st.cache_resource
+def get_auth_service():
+    return AuthService(get_supabase(), AUTH_MAX_FAILURES, AUTH_FAILURE_WINDOW, AUTH_MAX_TRACKED_USERNAMES,
+                       AUTH_MAX_CONCURRENT_HASHES, AUTH_HASH_WAIT)
+
+def create_user(username, password):
+    try:
+        with track("create_user"):
+            return get_auth_service().create(username, password)
     except Exception as e:
         st.error(f"Error creating user: {str(e)}")
         return False
 
 def verify_user(username, password):
-    hashed_pw = hash_password(password)
     try:
-        response = supabase.table('users').select('*').eq('username', username).eq('password_hash', hashed_pw).execute()
-        return len(response.data) > 0
+        with track("verify_user"):
+            return get_auth_service().verify(username, password)
     except Exception as e:
         st.error(f"Error verifying user: {str(e)}")
         return False
@@ -70,20 +434,508 @@ def save_user_data(table, data):
     data['user_id'] = st.session_state['user_id']
     data['logged_at'] = str(datetime.datetime.now())
     try:
-        supabase.table(table).insert(data).execute()
+        with track(f"save_user_data:{table}") as call:
+            get_local_store().put(table, data['user_id'], [data])
+            get_write_queue().enqueue(table, [data])
+            get_read_cache().patch(data['user_id'], table, [dict(data)])
+            get_rollups().record(data['user_id'], table, [data])
+            call['size'] = payload_size(data)
+        return True
+    except Exception as e:
+        st.error(f"Error saving data: {str(e)}")
+        return False
+
+def save_user_rows(table, rows):
+    """Insert several rows for the current user in a single round trip."""
+    now = datetime.datetime.now()
+    for i, data in enumerate(rows):
+        data['user_id'] = st.session_state['user_id']
+        # Keep logged_at distinct so rows from one batch stay ordered
+        data['logged_at'] = str(now + datetime.timedelta(microseconds=i))
+    try:
+        with track(f"save_user_data:{table}") as call:
+            get_local_store().put(table, st.session_state['user_id'], rows)
+            get_write_queue().enqueue(table, rows)
+            get_read_cache().patch(st.session_state['user_id'], table, [dict(data) for data in rows])
+            get_rollups().record(st.session_state['user_id'], table, rows)
+            call['size'] = payload_size(rows)
         return True
     except Exception as e:
         st.error(f"Error saving data: {str(e)}")
         return False
 
+def fetch_rows_since(client, table, user_id, since=None, page_size=SYNC_PAGE_SIZE, metrics=None):
+    """Yield pages of a user's rows inserted after row id ``since``, in insertion order.
+
+    Pages are keyed on the server-assigned ``id`` rather than ``logged_at`` or offsets,
+    so rows that reach Supabase late with an old ``logged_at`` are still picked up, and
+    each page is one indexed range scan no matter how long the user's history is.
+    """
+    while True:
+        query = client.table(table).select(SYNC_COLUMNS.get(table, '*')).eq('user_id', user_id)
+        if since is not None:
+            query = query.gt('id', since)
+        with track(f"supabase.select:{table}", metrics) as call:
+            page = query.order('id').limit(page_size).execute().data
+            call['size'] = payload_size(page)
+        if not page:
+            return
+        # Callers may strip ids from the rows they are handed
+        last_id = page[-1]['id']
+        yield page
+        if len(page) < page_size:
+            return
+        since = last_id
+
 def load_user_data(table):
+    """The current user's rows, oldest first, read from the local store."""
+    user_id = st.session_state['user_id']
+    get_local_sync().watch(user_id, table)
+    cache = get_read_cache()
+    rows = cache.get(user_id, table)
+    if rows is not None:
+        return rows
     try:
-        response = supabase.table(table).select('*').eq('user_id', st.session_state['user_id']).execute()
-        return response.data
+        with track(f"load_user_data:{table}"):
+            store = get_local_store()
+            pulled, _ = store.cursor(table, user_id)
+            if not pulled:
+                # First read on this device: adopt rows journaled before the local store
+                # existed, then pull the history once so the page does not start empty
+                store.put(table, user_id, get_write_queue().pending(table, user_id))
+                try:
+                    get_local_sync().pull(user_id, table)
+                except Exception as e:
+                    logger.warning("Initial pull of %s for %s failed: %s", table, user_id, e)
+                    st.warning("Couldn't reach the server; showing entries saved on this device.")
+                    # Leave the retry to the background sync instead of blocking every cache miss
+                    store.merge(table, user_id, [], None)
+            rows = store.rows(table, user_id)
+            cache.put(user_id, table, rows)
+        return rows
     except Exception as e:
         st.error(f"Error loading data: {str(e)}")
         return []
 
+def load_user_frame(table):
+    """Return the user's rows as a DataFrame, converting only rows added since the last call.
+
+    Rows pulled late can land in the middle of the list; the frame is then rebuilt,
+    which shows up as its last row no longer sitting at the same position.
+    """
+    import pandas as pd
+    rows = load_user_data(table)
+    frame, last_key = st.session_state.frames.get(table, (None, None))
+    if (frame is None or len(frame) > len(rows)
+            or (len(frame) and logged_at_key(rows[len(frame) - 1].get('logged_at')) != last_key)):
+        frame = pd.DataFrame(rows)
+    elif len(frame) < len(rows):
+        frame = pd.concat([frame, pd.DataFrame(rows[len(frame):])], ignore_index=True)
+    last_key = logged_at_key(rows[-1].get('logged_at')) if rows else None
+    st.session_state.frames[table] = (frame, last_key)
+    return frame
+
+def load_rollups(*tables):
+    """Bring the current user's rollups for ``tables`` up to date and return them."""
+    rollups = get_rollups()
+    for table in tables:
+        rollups.sync(st.session_state['user_id'], table, load_user_data(table))
+    return rollups
+
+# Bulk Import and Export
+def read_transfer_chunks(uploaded_file, chunk_rows=TRANSFER_CHUNK_ROWS):
+    """Yield DataFrames of at most ``chunk_rows`` rows from a CSV or Parquet upload."""
+    import pandas as pd
+    if uploaded_file.name.lower().endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(uploaded_file).iter_batches(batch_size=chunk_rows):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(uploaded_file, chunksize=chunk_rows, dtype=str, keep_default_na=False)
+
+def parse_timestamps(values):
+    """Parse timestamps to naive datetimes; unreadable values become NaT.
+
+    UTC offsets are dropped rather than converted, since logged_at holds local wall time.
+    """
+    import pandas as pd
+    values = values.astype(str).str.strip().str.replace(r'(?:Z|[+-]\d\d:?\d\d)$', '', regex=True)
+    parsed = pd.to_datetime(values, errors='coerce', format='ISO8601')
+    retry = parsed.isna() & (values != '')
+    if retry.any():
+        # Other trackers' exports are rarely ISO 8601, so let pandas infer their format
+        parsed = parsed.where(~retry, pd.to_datetime(values[retry], errors='coerce'))
+    return parsed
+
+def logged_at_key(logged_at):
+    """Normalize a logged_at value so keys written by different tools compare equal.
+
+    Like ``parse_timestamps``, a UTC offset is dropped rather than converted, so a
+    ``timestamptz`` column's ``...+00:00`` copy of a local wall time keys the same.
+    """
+    try:
+        return str(datetime.datetime.fromisoformat(str(logged_at)).replace(tzinfo=None))
+    except ValueError:
+        return str(logged_at)
+
+def validate_transfer_chunk(table, frame):
+    """Coerce one chunk to ``table``'s columns; returns ``(rows, rejected_count)``."""
+    import numpy as np
+    import pandas as pd
+    columns = TRANSFER_COLUMNS[table]
+    missing = [name for name in columns if name not in frame.columns and name not in TRANSFER_DERIVED]
+    if missing:
+        raise ValueError(f"Missing columns for {table}: {', '.join(missing)}")
+    logged_at = parse_timestamps(frame['logged_at'])
+    valid = logged_at.notna()
+    clean = {}
+    for name, kind in columns.items():
+        if name == 'logged_at':
+            continue
+        if kind == 'number':
+            clean[name] = pd.to_numeric(frame[name], errors='coerce')
+            # Unreadable, infinite and negative amounts are rejected here rather than by Supabase
+            valid &= np.isfinite(clean[name]) & (clean[name] >= 0)
+            continue
+        text = frame[name].fillna('').astype(str).str.strip() if name in frame.columns else pd.Series('', index=frame.index)
+        if name in TRANSFER_DERIVED:
+            text = text.where(text != '', logged_at.dt.strftime(TRANSFER_DERIVED[name]))
+        else:
+            valid &= text != ''
+        clean[name] = text
+    rows = []
+    for i in np.flatnonzero(valid.to_numpy()):
+        row = {'logged_at': str(logged_at.iloc[i].to_pydatetime())}
+        for name, values in clean.items():
+            value = values.iloc[i]
+            if columns[name] == 'number':
+                value = float(value)
+                value = int(value) if value.is_integer() else value
+            row[name] = value
+        rows.append(row)
+    return rows, len(frame) - len(rows)
+
+def import_user_rows(table, uploaded_file, chunk_rows=TRANSFER_CHUNK_ROWS):
+    """Stream a CSV or Parquet file into ``table`` for the current user.
+
+    Each chunk is validated, deduplicated on logged_at against stored rows and earlier
+    chunks, written to the local store and queued for Supabase, where the write-behind
+    queue sends it as bulk inserts. Memory is bounded by the chunk size and the key set
+    rather than the file. Rows stored before a failure stay; importing the same file
+    again skips them. Returns counts of imported, duplicate and rejected rows.
+    """
+    user_id = st.session_state['user_id']
+    stats = {'imported': 0, 'duplicates': 0, 'rejected': 0}
+    seen = {logged_at_key(row.get('logged_at')) for row in load_user_data(table)}
+    store, queue = get_local_store(), get_write_queue()
+    try:
+        for frame in read_transfer_chunks(uploaded_file, chunk_rows):
+            rows, rejected = validate_transfer_chunk(table, frame)
+            stats['rejected'] += rejected
+            fresh = []
+            for row in rows:
+                if row['logged_at'] in seen:
+                    stats['duplicates'] += 1
+                    continue
+                seen.add(row['logged_at'])
+                row['user_id'] = user_id
+                fresh.append(row)
+            if fresh:
+                store.put(table, user_id, fresh)
+                queue.enqueue(table, fresh)
+                stats['imported'] += len(fresh)
+    finally:
+        if stats['imported']:
+            # Imported rows land between existing ones, so cached copies and everything
+            # derived from them are rebuilt from a full read
+            get_read_cache().invalidate(user_id, table)
+            get_rollups().invalidate(user_id)
+            st.session_state.frames.pop(table, None)
+            if table == 'health_logs':
+                st.session_state.health_logs = HealthLogStore.from_rows(load_user_data('health_logs'))
+    return stats
+
+def export_user_rows(table, user_id, fmt, page_size=SYNC_PAGE_SIZE):
+    """Encode a user's ``table`` as CSV or Parquet bytes, reading it one page at a time.
+
+    Runs when the download button is clicked, outside the script run, so it takes the
+    user explicitly. Paging keeps only one page of row dicts alive at once; the encoded
+    file itself is held in memory, as Streamlit keeps it there to serve the download.
+    """
+    columns = TRANSFER_COLUMNS[table]
+    out = BytesIO()
+    pages = get_local_store().pages(table, user_id, page_size)
+    if fmt == 'parquet':
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        schema = pa.schema([(name, pa.float64() if kind == 'number' else pa.string()) for name, kind in columns.items()])
+        with pq.ParquetWriter(out, schema) as writer:
+            for page in pages:
+                writer.write_table(pa.Table.from_pylist(page, schema=schema))
+    else:
+        text = TextIOWrapper(out, encoding='utf-8', newline='')
+        writer = csv.DictWriter(text, list(columns), extrasaction='ignore')
+        writer.writeheader()
+        for page in pages:
+            writer.writerows(page)
+        text.flush()
+        text.detach()
+    return out.getvalue()
+
+# Health metrics are stored under the column names used in the health_logs table
+HEALTH_METRICS = ('blood_pressure', 'sugar_level', 'cholesterol')
+HEALTH_LABELS = {
+    'date': 'Date',
+    'blood_pressure': 'Blood Pressure',
+    'sugar_level': 'Sugar Level',
+    'cholesterol': 'Cholesterol'
+}
+
+HEALTH_UNITS = {'blood_pressure': 'mmHg', 'sugar_level': 'mg/dL', 'cholesterol': 'mg/dL'}
+# Readings above these are shown as elevated/high
+HEALTH_LIMITS = {'blood_pressure': 120, 'sugar_level': 100, 'cholesterol': 200}
+
+class HealthLogStore:
+    """Append-only columnar store of health readings backed by growable numpy arrays.
+
+    Capacity doubles when full, so appends are amortized O(1). Filled rows are never
+    rewritten, which lets ``columns`` and ``frame`` hand out views without copying.
+    """
+
+    def __init__(self, capacity=64):
+        # Buffers are allocated on first use, so an empty store does not import numpy
+        self._capacity = capacity
+        self._dates = None
+        self._metrics = {}
+        self._size = 0
+        self.version = 0
+
+    def _allocate(self):
+        import numpy as np
+        self._dates = np.empty(self._capacity, dtype='datetime64[s]')
+        self._metrics = {name: np.empty(self._capacity, dtype=np.float64) for name in HEALTH_METRICS}
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Build a store from health_logs rows as returned by ``load_user_data``."""
+        store = cls(max(64, len(rows)))
+        for row in rows:
+            store.append(row.get('date') or row['logged_at'], *(row[name] for name in HEALTH_METRICS))
+        return store
+
+    def __len__(self):
+        return self._size
+
+    @property
+    def empty(self):
+        return self._size == 0
+
+    def append(self, date, blood_pressure, sugar_level, cholesterol):
+        import pandas as pd
+        if self._dates is None:
+            self._allocate()
+        elif self._size == len(self._dates):
+            self._grow()
+        i = self._size
+        self._dates[i] = pd.Timestamp(date).to_datetime64()
+        self._metrics['blood_pressure'][i] = blood_pressure
+        self._metrics['sugar_level'][i] = sugar_level
+        self._metrics['cholesterol'][i] = cholesterol
+        self._size += 1
+        self.version += 1
+
+    def _grow(self):
+        import numpy as np
+        # Earlier views keep pointing at the old buffers, which still hold the same rows
+        capacity = 2 * len(self._dates)
+        dates = np.empty(capacity, dtype=self._dates.dtype)
+        dates[:self._size] = self._dates[:self._size]
+        self._dates = dates
+        for name, values in self._metrics.items():
+            grown = np.empty(capacity, dtype=values.dtype)
+            grown[:self._size] = values[:self._size]
+            self._metrics[name] = grown
+
+    def columns(self):
+        """Read-only views of the filled part of each column, keyed by canonical name."""
+        if self._dates is None:
+            self._allocate()
+        views = {'date': self._dates[:self._size]}
+        views.update((name, values[:self._size]) for name, values in self._metrics.items())
+        for view in views.values():
+            view.flags.writeable = False
+        return views
+
+    def latest(self):
+        i = self._size - 1
+        return {'date': self._dates[i], **{name: values[i] for name, values in self._metrics.items()}}
+
+    def frame(self, labels=None):
+        """DataFrame over the stored columns, optionally renamed with ``labels``."""
+        import pandas as pd
+        labels = labels or {}
+        return pd.DataFrame(
+            {labels.get(name, name): view for name, view in self.columns().items()}, copy=False
+        )
+
+# Trend chart windows in days; None shows the whole history
+CHART_WINDOWS = {"30 days": 30, "90 days": 90, "1 year": 365, "All": None}
+
+def lttb(x, y, threshold):
+    """Indices Largest-Triangle-Three-Buckets keeps to draw ``y`` over ``x`` with ``threshold`` points.
+
+    The first and last points are always kept; each bucket in between contributes the
+    point forming the largest triangle with the previous pick and the next bucket's mean.
+    """
+    import numpy as np
+    n = len(x)
+    if threshold >= n or threshold < 3:
+        return np.arange(n)
+    keep = np.empty(threshold, dtype=np.int64)
+    keep[0], keep[-1] = 0, n - 1
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    edges = np.append(edges, n)
+    picked = 0
+    for i in range(threshold - 2):
+        start, end = edges[i], edges[i + 1]
+        mean_x = x[end:edges[i + 2]].mean()
+        mean_y = y[end:edges[i + 2]].mean()
+        area = np.abs((x[picked] - mean_x) * (y[start:end] - y[picked])
+                      - (x[picked] - x[start:end]) * (mean_y - y[picked]))
+        picked = start + int(np.argmax(area))
+        keep[i + 1] = picked
+    return keep
+
+def health_trend_figure(store, days, max_points=CHART_MAX_POINTS):
+    """Trend chart of the last ``days`` of readings, each series reduced to ``max_points`` with LTTB.
+
+    Figures are memoized per session by store version and window, so reruns that do not
+    add a reading reuse the previous figure.
+    """
+    import numpy as np
+    import plotly.graph_objects as go
+    key = (id(store), store.version, days, max_points)
+    cache = st.session_state.chart_cache
+    if key in cache:
+        return cache[key]
+    columns = store.columns()
+    dates = columns['date']
+    # Readings are appended in time order, so a window is a contiguous tail
+    start = 0 if days is None else int(np.searchsorted(dates, dates[-1] - np.timedelta64(days, 'D')))
+    dates = dates[start:]
+    x = dates.astype(np.int64).astype(np.float64)
+    fig = go.Figure()
+    for name in HEALTH_METRICS:
+        values = columns[name][start:]
+        keep = lttb(x, values, max_points)
+        fig.add_trace(go.Scatter(x=dates[keep], y=values[keep], mode='lines+markers' if len(keep) <= 60 else 'lines',
+                                 name=HEALTH_LABELS[name]))
+    fig.update_layout(title="Your Health Metrics Over Time", xaxis_title="Date", hovermode="x unified")
+    if len(cache) >= CHART_CACHE_ENTRIES:
+        cache.pop(next(iter(cache)))
+    cache[key] = fig
+    return fig
+
+def estimate_tokens(text):
+    """Rough token count for prompt budgeting (about four characters per token)."""
+    return len(text) // 4
+
+class HealthContextBuilder:
+    """Bounded text summary of a HealthLogStore for health-insight prompts.
+
+    All-time stats and out-of-range episodes are folded in once per reading as the
+    store grows; recent windows are read from the store's tail. Building a prompt
+    therefore never walks the full history, and its size does not grow with it.
+    """
+
+    MAX_EPISODES = 3
+
+    def __init__(self, store):
+        self.store = store
+        self.synced = 0
+        self.totals = {name: {'min': float('inf'), 'max': float('-inf'), 'sum': 0.0} for name in HEALTH_METRICS}
+        self.episode_counts = dict.fromkeys(HEALTH_METRICS, 0)
+        self.episodes = {name: deque(maxlen=self.MAX_EPISODES) for name in HEALTH_METRICS}
+        self._open = dict.fromkeys(HEALTH_METRICS)
+
+    def sync(self):
+        columns = self.store.columns()
+        for i in range(self.synced, len(self.store)):
+            day = str(columns['date'][i])[:10]
+            for name in HEALTH_METRICS:
+                value = float(columns[name][i])
+                totals = self.totals[name]
+                totals['min'] = min(totals['min'], value)
+                totals['max'] = max(totals['max'], value)
+                totals['sum'] += value
+                # An episode is a run of consecutive readings above the limit
+                if value <= HEALTH_LIMITS[name]:
+                    self._open[name] = None
+                elif self._open[name] is None:
+                    self._open[name] = {'start': day, 'end': day, 'peak': value, 'readings': 1}
+                    self.episodes[name].append(self._open[name])
+                    self.episode_counts[name] += 1
+                else:
+                    episode = self._open[name]
+                    episode['end'], episode['peak'] = day, max(episode['peak'], value)
+                    episode['readings'] += 1
+        self.synced = len(self.store)
+
+    def build(self, budget=HEALTH_CONTEXT_TOKEN_BUDGET):
+        """Summary text within ``budget`` tokens; detail is dropped until it fits."""
+        self.sync()
+        for recent, with_episodes in ((14, True), (7, True), (3, True), (3, False), (1, False), (0, False)):
+            lines = self._render(recent, with_episodes)
+            text = "\n".join(lines)
+            if estimate_tokens(text) <= budget:
+                return text
+        # Even the bare stats are too long: drop metrics from the end, then cut the text
+        while len(lines) > 1 and estimate_tokens(text) > budget:
+            lines.pop()
+            text = "\n".join(lines)
+        return text[:budget * 4]
+
+    def _render(self, recent, with_episodes):
+        import numpy as np
+        columns = self.store.columns()
+        dates, count = columns['date'], len(self.store)
+        lines = [f"{count} readings from {str(dates[0])[:10]} to {str(dates[-1])[:10]}."]
+        for name in HEALTH_METRICS:
+            values, totals = columns[name], self.totals[name]
+            parts = [f"latest {values[-1]:g}"]
+            for days in (7, 30):
+                start = int(np.searchsorted(dates, dates[-1] - np.timedelta64(days, 'D')))
+                window = values[start:]
+                parts.append(f"{days}-day mean {window.mean():.0f} ({window.min():g}-{window.max():g})")
+            parts.append(f"all-time mean {totals['sum'] / count:.0f} ({totals['min']:g}-{totals['max']:g})")
+            start = int(np.searchsorted(dates, dates[-1] - np.timedelta64(30, 'D')))
+            if count - start >= 3:
+                elapsed_days = (dates[start:] - dates[start]).astype(np.float64) / 86400
+                if elapsed_days[-1] > 0:
+                    slope = np.polyfit(elapsed_days, values[start:], 1)[0] * 7
+                    parts.append(f"30-day trend {slope:+.1f} per week")
+            lines.append(f"{HEALTH_LABELS[name]} ({HEALTH_UNITS[name]}, limit {HEALTH_LIMITS[name]}): " + "; ".join(parts))
+        if with_episodes:
+            for name in HEALTH_METRICS:
+                if self.episode_counts[name]:
+                    latest = "; ".join(
+                        f"{e['start']} to {e['end']} peak {e['peak']:g} ({e['readings']} readings)"
+                        for e in reversed(self.episodes[name])
+                    )
+                    lines.append(f"{HEALTH_LABELS[name]} above limit: {self.episode_counts[name]} episodes, latest {latest}")
+        if recent:
+            lines.append(f"Last {min(recent, count)} readings (date, BP, sugar, cholesterol):")
+        for i in range(max(0, count - recent), count):
+            lines.append(f"{str(dates[i])[:16].replace('T', ' ')}, " + ", ".join(f"{columns[name][i]:g}" for name in HEALTH_METRICS))
+        return lines
+
+def health_context():
+    """The session's context builder for its current health log store."""
+    builder = st.session_state.get('health_context')
+    if builder is None or builder.store is not st.session_state.health_logs:
+        builder = st.session_state.health_context = HealthContextBuilder(st.session_state.health_logs)
+    return builder
+
 # Initialize Session State
 def init_session_state():
     if 'authenticated' not in st.session_state:
@@ -92,7 +944,7 @@ def init_session_state():
     
     # Initialize data structures
     if 'health_logs' not in st.session_state:
-        st.session_state.health_logs = pd.DataFrame(columns=['Date', 'Blood Pressure', 'Sugar Level', 'Cholesterol'])
+        st.session_state.health_logs = HealthLogStore()
     
     if 'calorie_data' not in st.session_state:
         st.session_state.calorie_data = {
@@ -112,12 +964,1104 @@ def init_session_state():
     
     if 'food_logs' not in st.session_state:
         st.session_state.food_logs = []
+    
+    if 'frames' not in st.session_state:
+        st.session_state.frames = {}
+    
+    if 'jobs' not in st.session_state:
+        st.session_state.jobs = {}
+        # Identifies this session to the shared AI job queue
+        st.session_state.job_subscriber = uuid.uuid4().hex
+        st.session_state.saved_jobs = set()
+        st.session_state.food_batch = None
+    
+    if 'chart_cache' not in st.session_state:
+        st.session_state.chart_cache = {}
+    
+    if 'prepared_uploads' not in st.session_state:
+        st.session_state.prepared_uploads = {}
 
 init_session_state()
 
-# AI Helper Functions (unchanged from your original code)
-def analyze_food_image(image):
-    """Analyze food image using Gemini and return nutritional info and suggestions."""
+# Local Storage
+@st.cache_resource
+def get_local_db():
+    """Open the process-wide SQLite database shared by the local caches."""
+    conn = sqlite3.connect(LOCAL_DB_PATH, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn, threading.Lock()
+
+class DiskCache:
+    """SQLite-backed JSON cache with TTL expiry, LRU eviction and hit/miss counters."""
+
+    def __init__(self, namespace, ttl, max_entries):
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._conn, self._lock = get_local_db()
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_entries ("
+                "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL, "
+                "PRIMARY KEY (namespace, key))"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_cache_entries_lru ON cache_entries (namespace, accessed_at)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache_stats ("
+                "namespace TEXT PRIMARY KEY, hits INTEGER NOT NULL DEFAULT 0, misses INTEGER NOT NULL DEFAULT 0)"
+            )
+            self._conn.execute("INSERT OR IGNORE INTO cache_stats (namespace) VALUES (?)", (namespace,))
+
+    def _count(self, column):
+        self._conn.execute(f"UPDATE cache_stats SET {column} = {column} + 1 WHERE namespace = ?", (self.namespace,))
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key)
+            ).fetchone()
+            if row is None or now - row[1] > self.ttl:
+                if row is not None:
+                    self._conn.execute(
+                        "DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key)
+                    )
+                self._count('misses')
+                return None
+            self._conn.execute(
+                "UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                (now, self.namespace, key)
+            )
+            self._count('hits')
+        return json.loads(row[0])
+
+    def put(self, key, value):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache_entries (namespace, key, value, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (self.namespace, key, json.dumps(value), now, now)
+            )
+            # Evict least recently used entries beyond the size bound
+            self._conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key IN ("
+                "SELECT key FROM cache_entries WHERE namespace = ? ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                (self.namespace, self.namespace, self.max_entries)
+            )
+
+    def stats(self):
+        with self._lock:
+            hits, misses = self._conn.execute(
+                "SELECT hits, misses FROM cache_stats WHERE namespace = ?", (self.namespace,)
+            ).fetchone()
+            entries = self._conn.execute(
+                "SELECT COUNT(*) FROM cache_entries WHERE namespace = ?", (self.namespace,)
+            ).fetchone()[0]
+        lookups = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'entries': entries,
+            'hit_rate': hits / lookups if lookups else 0.0
+        }
+
+class WriteBehindQueue:
+    """Durable per-table insert buffer flushed to Supabase as bulk upserts.
+
+    Rows are journaled in the local SQLite database before ``enqueue`` returns, so
+    pending writes survive a crash and are replayed by the next process. Delivery is
+    at least once, so rows are upserted on ``(user_id, logged_at)`` and a resend after
+    a lost response is ignored by the server. A failed chunk is retried with backoff in
+    smaller and smaller chunks, which isolates rows the server keeps rejecting; after
+    WRITE_MAX_ATTEMPTS they move to ``dead_writes`` so they stop holding up the rest.
+    """
+
+    def __init__(self, client, batch_size, flush_interval, on_flushed=None, metrics=None):
+        self.client = client
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.on_flushed = on_flushed
+        self.metrics = metrics
+        self._conn, self._lock = get_local_db()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS pending_writes ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, table_name TEXT NOT NULL, "
+                "user_id TEXT, payload TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL DEFAULT 0, retry_at REAL NOT NULL DEFAULT 0)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS dead_writes ("
+                "id INTEGER PRIMARY KEY, table_name TEXT NOT NULL, user_id TEXT, payload TEXT NOT NULL, "
+                "attempts INTEGER NOT NULL, error TEXT, failed_at REAL NOT NULL)"
+            )
+            self._pending = self._conn.execute("SELECT COUNT(*) FROM pending_writes").fetchone()[0]
+        threading.Thread(target=self._run, name="wellher-write-behind", daemon=True).start()
+
+    def enqueue(self, table, rows):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO pending_writes (table_name, user_id, payload) VALUES (?, ?, ?)",
+                [(table, row.get('user_id'), json.dumps(row)) for row in rows]
+            )
+            self._pending += len(rows)
+            pending = self._pending
+        if pending >= self.batch_size:
+            self._wake.set()
+
+    def wake(self):
+        """Ask the background flusher to send pending rows now instead of at the next interval."""
+        self._wake.set()
+
+    def pending(self, table, user_id):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT payload FROM pending_writes WHERE table_name = ? AND user_id = ? ORDER BY id",
+                (table, user_id)
+            ).fetchall()
+        return [json.loads(payload) for (payload,) in rows]
+
+    def dead_letters(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM dead_writes").fetchone()[0]
+
+    def flush(self):
+        """Send every journaled row that is due, reading the journal WRITE_MAX_BULK rows at a time."""
+        with self._flush_lock:
+            after = 0
+            while True:
+                with self._lock:
+                    batch = self._conn.execute(
+                        "SELECT id, table_name, payload, attempts FROM pending_writes "
+                        "WHERE id > ? AND retry_at <= ? ORDER BY id LIMIT ?",
+                        (after, time.time(), WRITE_MAX_BULK)
+                    ).fetchall()
+                if not batch:
+                    return
+                after = batch[-1][0]
+                groups = {}
+                for row_id, table, payload, attempts in batch:
+                    groups.setdefault((table, attempts), []).append((row_id, json.loads(payload)))
+                failures = 0
+                for (table, attempts), items in groups.items():
+                    # Each failed attempt cuts the chunk to an eighth, down to single rows
+                    size = max(1, WRITE_MAX_BULK >> (3 * attempts))
+                    for start in range(0, len(items), size):
+                        failures = 0 if self._send(table, attempts, items[start:start + size]) else failures + 1
+                        if failures >= 3:
+                            # Supabase is most likely down; the rest waits for the next pass
+                            return
+
+    def _send(self, table, attempts, chunk):
+        rows = [row for _, row in chunk]
+        ids = [(row_id,) for row_id, _ in chunk]
+        try:
+            with track(f"supabase.insert:{table}", self.metrics) as call:
+                self.client.table(table).upsert(
+                    rows, on_conflict='user_id,logged_at', ignore_duplicates=True
+                ).execute()
+                call['size'] = payload_size(rows)
+        except Exception as e:
+            attempts += 1
+            with self._lock:
+                if attempts >= WRITE_MAX_ATTEMPTS:
+                    logger.error("Giving up on %d rows for %s after %d attempts: %s", len(chunk), table, attempts, e)
+                    self._conn.executemany(
+                        "INSERT INTO dead_writes SELECT id, table_name, user_id, payload, ?, ?, ? "
+                        "FROM pending_writes WHERE id = ?",
+                        [(attempts, str(e), time.time(), row_id) for (row_id,) in ids]
+                    )
+                    self._conn.executemany("DELETE FROM pending_writes WHERE id = ?", ids)
+                    self._pending -= len(ids)
+                else:
+                    logger.warning("Flushing %d rows to %s failed (attempt %d): %s", len(chunk), table, attempts, e)
+                    retry_at = time.time() + min(WRITE_RETRY_MAX_BACKOFF, self.flush_interval * 2 ** attempts)
+                    self._conn.executemany(
+                        "UPDATE pending_writes SET attempts = ?, retry_at = ? WHERE id = ?",
+                        [(attempts, retry_at, row_id) for (row_id,) in ids]
+                    )
+            return False
+        with self._lock:
+            self._conn.executemany("DELETE FROM pending_writes WHERE id = ?", ids)
+            self._pending -= len(ids)
+        if self.on_flushed is not None:
+            self.on_flushed(table, rows)
+        return True
+
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Write-behind flush failed")
+
+@st.cache_resource
+def get_write_queue():
+    queue = WriteBehindQueue(get_supabase(), WRITE_BATCH_SIZE, WRITE_FLUSH_INTERVAL, get_local_store().mark_clean,
+                             get_metrics())
+    atexit.register(queue.flush)
+    return queue
+
+class ReadCache:
+    """Process-wide cache of each user's table rows with TTL expiry and a total size bound.
+
+    Writes made through ``save_user_data`` and rows pulled by ``LocalSync`` are patched
+    into the cached rows, so a table is only reread from the local store once its entry
+    expires or is evicted.
+    """
+
+    def __init__(self, ttl, max_bytes):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _size(rows, sample=64):
+        """Approximate memory held by ``rows``: the list, each dict, and its keys and values.
+
+        Rows are decoded one payload at a time, so their keys are not shared and count per
+        row too. Long tables are estimated from an even sample of rows.
+        """
+        if not rows:
+            return sys.getsizeof(rows)
+        step = max(1, len(rows) // sample)
+        sampled = rows[::step]
+        per_row = sum(
+            sys.getsizeof(row) + sum(sys.getsizeof(key) + sys.getsizeof(value) for key, value in row.items())
+            for row in sampled
+        ) / len(sampled)
+        return sys.getsizeof(rows) + int(per_row * len(rows))
+
+    def get(self, user_id, table):
+        with self._lock:
+            entry = self._entries.get((user_id, table))
+            if entry is None or time.monotonic() - entry['loaded_at'] > self.ttl:
+                return None
+            self._entries.move_to_end((user_id, table))
+            return entry['rows']
+
+    def put(self, user_id, table, rows):
+        size = self._size(rows)
+        with self._lock:
+            self._drop((user_id, table))
+            self._entries[(user_id, table)] = {'rows': rows, 'loaded_at': time.monotonic(), 'size': size}
+            self._bytes += size
+            self._evict()
+
+    def patch(self, user_id, table, rows):
+        """Add fresh rows to a cached table in logged_at order; uncached tables are left alone."""
+        size = self._size(rows)
+        with self._lock:
+            entry = self._entries.get((user_id, table))
+            if entry is None:
+                return
+            # Build a new list so callers still holding the previous rows are unaffected
+            cached = entry['rows']
+            entry['rows'] = cached + rows
+            last = logged_at_key(cached[-1].get('logged_at')) if cached else ''
+            if any(logged_at_key(row.get('logged_at')) < last for row in rows):
+                # Rows pulled late can be older than the cached tail; the sort is stable
+                # and nearly linear on a mostly ordered list
+                entry['rows'].sort(key=lambda row: logged_at_key(row.get('logged_at')))
+            entry['size'] += size
+            self._bytes += size
+            self._evict()
+
+    def invalidate(self, user_id, table=None):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == user_id and table in (None, key[1])]:
+                self._drop(key)
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry['size']
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and len(self._entries) > 1:
+            self._drop(next(iter(self._entries)))
+
+@st.cache_resource
+def get_read_cache():
+    return ReadCache(READ_CACHE_TTL, READ_CACHE_MAX_BYTES)
+
+class LocalStore:
+    """Local-first copy of each user's table rows in the shared SQLite database.
+
+    Every read is served from here and every write lands here before it is queued for
+    Supabase. Rows are keyed by table, user and normalized logged_at, so an entry pulled
+    back from Supabase merges with the local copy instead of duplicating it. Local
+    writes stay dirty until the write-behind queue has sent them; a dirty row wins over
+    the remote copy, a clean one is replaced by it.
+    """
+
+    def __init__(self):
+        self._conn, self._lock = get_local_db()
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS local_rows ("
+                "table_name TEXT NOT NULL, user_id TEXT NOT NULL, logged_at TEXT NOT NULL, "
+                "payload TEXT NOT NULL, dirty INTEGER NOT NULL DEFAULT 0, "
+                "PRIMARY KEY (table_name, user_id, logged_at)) WITHOUT ROWID"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sync_cursors ("
+                "table_name TEXT NOT NULL, user_id TEXT NOT NULL, pulled_id INTEGER, pulled_at REAL, "
+                "PRIMARY KEY (table_name, user_id))"
+            )
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                yield self._conn
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def put(self, table, user_id, rows):
+        """Store rows written on this device; they stay dirty until pushed."""
+        with self._transaction() as conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO local_rows VALUES (?, ?, ?, ?, 1)",
+                [(table, user_id, logged_at_key(row['logged_at']), json.dumps(row, default=str)) for row in rows]
+            )
+
+    def mark_clean(self, table, rows):
+        """Called by the write-behind queue once ``rows`` are in Supabase."""
+        with self._transaction() as conn:
+            conn.executemany(
+                "UPDATE local_rows SET dirty = 0 WHERE table_name = ? AND user_id = ? AND logged_at = ?",
+                [(table, row.get('user_id'), logged_at_key(row.get('logged_at'))) for row in rows]
+            )
+
+    def merge(self, table, user_id, rows, pulled_id):
+        """Apply a page pulled from Supabase and advance the cursor; returns rows new to this device."""
+        keys = [logged_at_key(row['logged_at']) for row in rows]
+        with self._transaction() as conn:
+            known = {
+                key for (key,) in conn.execute(
+                    "SELECT logged_at FROM local_rows WHERE table_name = ? AND user_id = ? "
+                    "AND logged_at BETWEEN ? AND ?", (table, user_id, min(keys), max(keys))
+                )
+            } if rows else set()
+            conn.executemany(
+                "INSERT INTO local_rows VALUES (?, ?, ?, ?, 0) "
+                "ON CONFLICT (table_name, user_id, logged_at) DO UPDATE SET payload = excluded.payload "
+                "WHERE dirty = 0",
+                [(table, user_id, key, json.dumps(row, default=str)) for key, row in zip(keys, rows)]
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO sync_cursors VALUES (?, ?, ?, ?)",
+                (table, user_id, pulled_id, time.time())
+            )
+        return [row for key, row in zip(keys, rows) if key not in known]
+
+    def cursor(self, table, user_id):
+        """``(pulled, pulled_id)``: whether the table was ever pulled, and the highest remote row id merged."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT pulled_id FROM sync_cursors WHERE table_name = ? AND user_id = ?", (table, user_id)
+            ).fetchone()
+        return (row is not None, row[0] if row else None)
+
+    def rows(self, table, user_id):
+        with self._lock:
+            payloads = self._conn.execute(
+                "SELECT payload FROM local_rows WHERE table_name = ? AND user_id = ? ORDER BY logged_at",
+                (table, user_id)
+            ).fetchall()
+        return [json.loads(payload) for (payload,) in payloads]
+
+    def pages(self, table, user_id, page_size=SYNC_PAGE_SIZE):
+        """Yield a user's rows oldest first in pages, keyed on logged_at like ``fetch_rows_since``."""
+        after = ''
+        while True:
+            with self._lock:
+                page = self._conn.execute(
+                    "SELECT logged_at, payload FROM local_rows WHERE table_name = ? AND user_id = ? "
+                    "AND logged_at > ? ORDER BY logged_at LIMIT ?", (table, user_id, after, page_size)
+                ).fetchall()
+            if not page:
+                return
+            yield [json.loads(payload) for _, payload in page]
+            after = page[-1][0]
+
+@st.cache_resource
+def get_local_store():
+    return LocalStore()
+
+class LocalSync:
+    """Background reconciliation of the LocalStore with Supabase.
+
+    Pushes go through the write-behind queue. Pulls fetch each recently read table past
+    its change cursor, the highest remote row id already merged, and fold new rows into
+    the read cache and rollups. Ids are handed out on insert but only become visible on
+    commit, so each pull also rereads the last ``overlap`` ids. Failed pulls are logged
+    and retried on the next pass, so pages keep rendering from local data while
+    Supabase is slow or down.
+
+    The sync thread has no script context, so the client, caches and metrics it
+    uses are handed in rather than looked up through their ``get_*`` functions.
+    """
+
+    def __init__(self, store, client, read_cache, rollups, metrics, interval, idle, overlap):
+        self.store = store
+        self.client = client
+        self.read_cache = read_cache
+        self.rollups = rollups
+        self.metrics = metrics
+        self.interval = interval
+        self.idle = idle
+        self.overlap = overlap
+        self._watched = {}
+        self._lock = threading.Lock()
+        threading.Thread(target=self._run, name="wellher-local-sync", daemon=True).start()
+
+    def watch(self, user_id, table):
+        """Keep pulling ``table`` for ``user_id`` until it goes unread for ``idle`` seconds."""
+        with self._lock:
+            self._watched[(user_id, table)] = time.monotonic()
+
+    def pull(self, user_id, table):
+        """Merge remote rows past the table's cursor; returns the rows that were new locally."""
+        _, pulled_id = self.store.cursor(table, user_id)
+        since = None if pulled_id is None else pulled_id - self.overlap
+        fresh = []
+        for page in fetch_rows_since(self.client, table, user_id, since, metrics=self.metrics):
+            pulled_id = max(pulled_id or 0, page[-1]['id'])
+            # Row ids only order the pull; local copies are keyed on logged_at
+            for row in page:
+                row.pop('id', None)
+            fresh += self.store.merge(table, user_id, page, pulled_id)
+        # Record the pull even when there was nothing to fetch
+        self.store.merge(table, user_id, [], pulled_id)
+        return fresh
+
+    def sync(self):
+        now = time.monotonic()
+        with self._lock:
+            for key in [key for key, seen in self._watched.items() if now - seen > self.idle]:
+                del self._watched[key]
+            watched = list(self._watched)
+        for user_id, table in watched:
+            try:
+                fresh = self.pull(user_id, table)
+            except Exception as e:
+                logger.warning("Pulling %s for %s failed: %s", table, user_id, e)
+                continue
+            if fresh:
+                self.read_cache.patch(user_id, table, fresh)
+                self.rollups.record(user_id, table, fresh)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sync()
+            except Exception:
+                logger.exception("Local sync failed")
+
+@st.cache_resource
+def get_local_sync():
+    return LocalSync(get_local_store(), get_supabase(), get_read_cache(), get_rollups(), get_metrics(),
+                     LOCAL_SYNC_INTERVAL, LOCAL_SYNC_IDLE, LOCAL_SYNC_ID_OVERLAP)
+
+def week_start(day):
+    """ISO date of the Monday starting the week that contains ``day``."""
+    date = datetime.date.fromisoformat(day)
+    return str(date - datetime.timedelta(days=date.weekday()))
+
+class Rollups:
+    """Per-user daily and weekly aggregates of food, calorie and health logs.
+
+    Each row is folded in once, either when ``save_user_data`` writes it or when a
+    dashboard first syncs it, so reading a window of buckets never rescans the log.
+    Rows are matched on ``logged_at_key``, so a row reread in Supabase's ISO form is
+    still recognized as already folded.
+    States idle for longer than ``ttl`` expire and the least recently used are evicted
+    past ``max_states``; the next dashboard sync rebuilds them.
+    """
+
+    def __init__(self, ttl, max_states):
+        self.ttl = ttl
+        self.max_states = max_states
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def sync(self, user_id, table, rows):
+        """Fold rows a dashboard loaded that have not been seen yet."""
+        with self._lock:
+            state = self._state((user_id, table))
+            synced = state['synced'] if state else 0
+            # Rows past the synced prefix are new, unless the list was refetched with rows
+            # dropped or inserted before that point; then the table is folded from scratch
+            if state is None or len(rows) < synced or (synced and logged_at_key(rows[synced - 1].get('logged_at')) != state['last_key']):
+                state = self._new_state((user_id, table))
+                synced = 0
+            for row in rows[synced:]:
+                key = logged_at_key(row.get('logged_at'))
+                if key in state['recorded']:
+                    # Already folded by ``record`` when it was written
+                    state['recorded'].discard(key)
+                else:
+                    self._fold(state, table, row)
+            state['synced'] = len(rows)
+            state['last_key'] = logged_at_key(rows[-1].get('logged_at')) if rows else None
+
+    def record(self, user_id, table, rows):
+        """Fold freshly written rows into a table that is already being rolled up."""
+        with self._lock:
+            state = self._state((user_id, table))
+            if state is None:
+                return
+            for row in rows:
+                key = logged_at_key(row.get('logged_at'))
+                if key in state['recorded']:
+                    continue
+                # Only kept until the next sync reaches the row, so this stays small
+                state['recorded'].add(key)
+                self._fold(state, table, row)
+
+    def _state(self, key):
+        state = self._states.get(key)
+        if state is None:
+            return None
+        if time.monotonic() - state['used_at'] > self.ttl:
+            del self._states[key]
+            return None
+        state['used_at'] = time.monotonic()
+        self._states.move_to_end(key)
+        return state
+
+    def _new_state(self, key):
+        self._states[key] = state = {
+            'recorded': set(), 'synced': 0, 'last_key': None, 'used_at': time.monotonic(),
+            'count': 0, 'total': 0, 'day': {}, 'week': {},
+        }
+        self._states.move_to_end(key)
+        while len(self._states) > self.max_states:
+            self._states.popitem(last=False)
+        return state
+
+    def _fold(self, state, table, row):
+        key = logged_at_key(row.get('logged_at'))
+        state['count'] += 1
+        day = (row.get('date') or key)[:10]
+        day_bucket = state['day'].setdefault(day, {})
+        week_bucket = state['week'].setdefault(week_start(day), {})
+        if table == 'food_logs':
+            calories = row.get('calories') or 0
+            state['total'] += calories
+            for bucket in (day_bucket, week_bucket):
+                bucket['calories_in'] = bucket.get('calories_in', 0) + calories
+                bucket['meals'] = bucket.get('meals', 0) + 1
+        elif table == 'calorie_tracking':
+            # Burned calories are logged as running totals, so a day keeps its latest one
+            if key >= day_bucket.get('out_at', ''):
+                burned = row.get('burned') or 0
+                week_bucket['calories_out'] = week_bucket.get('calories_out', 0) + burned - day_bucket.get('calories_out', 0)
+                day_bucket['calories_out'] = burned
+                day_bucket['out_at'] = key
+        elif table == 'health_logs':
+            for name in HEALTH_METRICS:
+                value = row.get(name)
+                if value is None:
+                    continue
+                for bucket in (day_bucket, week_bucket):
+                    stats = bucket.setdefault(name, {'min': value, 'max': value, 'sum': 0, 'count': 0})
+                    stats['min'] = min(stats['min'], value)
+                    stats['max'] = max(stats['max'], value)
+                    stats['sum'] += value
+                    stats['count'] += 1
+
+    def window(self, user_id, table, period, count):
+        """Aggregates for the ``count`` most recent days or weeks, newest first.
+
+        Periods without rows are included as empty dicts so windows of different
+        tables line up. Metric stats are flattened to ``<metric>_min/_max/_mean``.
+        """
+        today = datetime.date.today()
+        if period == 'week':
+            today -= datetime.timedelta(days=today.weekday())
+        step = datetime.timedelta(days=7 if period == 'week' else 1)
+        keys = [str(today - i * step) for i in range(count)]
+        with self._lock:
+            buckets = (self._state((user_id, table)) or {}).get(period, {})
+            window = []
+            for key in keys:
+                flat = {}
+                for name, value in buckets.get(key, {}).items():
+                    if isinstance(value, dict):
+                        flat[f"{name}_min"] = value['min']
+                        flat[f"{name}_max"] = value['max']
+                        flat[f"{name}_mean"] = value['sum'] / value['count']
+                    else:
+                        flat[name] = value
+                window.append((key, flat))
+        return window
+
+    def total(self, user_id, table):
+        with self._lock:
+            return (self._state((user_id, table)) or {}).get('total', 0)
+
+    def count(self, user_id, table):
+        with self._lock:
+            return (self._state((user_id, table)) or {}).get('count', 0)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            for key in [key for key in self._states if key[0] == user_id]:
+                del self._states[key]
+
+@st.cache_resource
+def get_rollups():
+    return Rollups(ROLLUP_TTL, ROLLUP_MAX_STATES)
+
+@st.cache_resource
+def get_analysis_cache():
+    return DiskCache('food_analysis', ANALYSIS_CACHE_TTL, ANALYSIS_CACHE_MAX_ENTRIES)
+
+@st.cache_resource
+def get_advice_cache():
+    return DiskCache('pcod_advice', ADVICE_CACHE_TTL, ADVICE_CACHE_MAX_ENTRIES)
+
+def preprocess_image(uploaded_file, max_side=IMAGE_MAX_SIDE, fmt=IMAGE_FORMAT, quality=IMAGE_QUALITY):
+    """Orient, downscale and re-encode an upload without metadata before sending it to Gemini.
+
+    Returns the re-encoded image together with byte counts before and after.
+    """
+    from PIL import Image, ImageOps
+    raw = uploaded_file.getvalue()
+    image = ImageOps.exif_transpose(Image.open(BytesIO(raw)))
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    image.thumbnail((max_side, max_side), Image.LANCZOS)
+    # Saving without exif/icc arguments drops all source metadata
+    buffer = BytesIO()
+    image.save(buffer, format=fmt, quality=quality, optimize=True)
+    encoded = buffer.getvalue()
+    return Image.open(BytesIO(encoded)), {
+        'bytes_before': len(raw),
+        'bytes_after': len(encoded),
+        'size': image.size
+    }
+
+def prepared_upload(uploaded_file):
+    """``(image, stats, fingerprint)`` for an upload, decoded once per file instead of on every rerun."""
+    prepared = st.session_state.prepared_uploads
+    entry = prepared.get(uploaded_file.file_id)
+    if entry is None:
+        image, stats = preprocess_image(uploaded_file)
+        entry = prepared[uploaded_file.file_id] = (image, stats, image_fingerprint(image))
+    return entry
+
+def image_fingerprint(image, hash_size=16):
+    """Perceptual difference hash of an image; unchanged by re-encoding or resizing."""
+    from PIL import Image
+    gray = image.convert("L").resize((hash_size + 1, hash_size), Image.LANCZOS)
+    # An "L" image holds one byte per pixel, row by row
+    pixels = gray.tobytes()
+    bits = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{bits:0{hash_size * hash_size // 4}x}"
+
+NUTRITION_FIELDS = ('calories', 'protein', 'carbs', 'fat')
+
+def normalize_food_name(name):
+    return " ".join(re.findall(r"[a-z0-9]+", name.lower()))
+
+class NutritionIndex:
+    """Search index over a bundled food table and the averaged results of past AI analyses.
+
+    History is persisted in the local SQLite database, but lookups only touch memory:
+    names are kept sorted for prefix search, with a word index for matches inside a
+    name and difflib as a fuzzy fallback. A history entry replaces the bundled one
+    once it has ``min_samples`` analyses behind it.
+    """
+
+    def __init__(self, table_path, min_samples):
+        self.min_samples = min_samples
+        self._conn, self._db_lock = get_local_db()
+        self._lock = threading.Lock()
+        self._bundled = {}
+        self._history = {}
+        if os.path.exists(table_path):
+            with open(table_path, newline='') as f:
+                for row in csv.DictReader(f):
+                    entry = {'name': row['name'], 'serving': row['serving'], 'source': 'bundled'}
+                    entry.update((field, float(row[field])) for field in NUTRITION_FIELDS)
+                    self._bundled[normalize_food_name(row['name'])] = entry
+        with self._db_lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS nutrition_history ("
+                "key TEXT PRIMARY KEY, name TEXT NOT NULL, calories REAL NOT NULL, protein REAL NOT NULL, "
+                "carbs REAL NOT NULL, fat REAL NOT NULL, balance_rating TEXT, samples INTEGER NOT NULL)"
+            )
+            rows = self._conn.execute(
+                "SELECT key, name, calories, protein, carbs, fat, balance_rating, samples FROM nutrition_history"
+            ).fetchall()
+        for key, name, calories, protein, carbs, fat, rating, samples in rows:
+            self._history[key] = {
+                'name': name, 'serving': None, 'source': 'history', 'calories': calories, 'protein': protein,
+                'carbs': carbs, 'fat': fat, 'balance_rating': rating, 'samples': samples
+            }
+        self._rebuild()
+
+    def _rebuild(self):
+        self._names = sorted(set(self._bundled) | set(self._history))
+        self._words = sorted((word, key) for key in self._names for word in key.split()[1:])
+        self._by_word = {}
+        for key in self._names:
+            for word in key.split():
+                self._by_word.setdefault(word, []).append(key)
+
+    def _entry(self, key):
+        history, bundled = self._history.get(key), self._bundled.get(key)
+        if history is not None and (bundled is None or history['samples'] >= self.min_samples):
+            entry = history
+        else:
+            entry = bundled
+        return dict(entry, key=key)
+
+    def search(self, query, limit=8):
+        """Foods whose name or any word in it starts with ``query``, else close spellings."""
+        query = normalize_food_name(query)
+        if not query:
+            return []
+        with self._lock:
+            keys = []
+            i = bisect_left(self._names, query)
+            while i < len(self._names) and self._names[i].startswith(query) and len(keys) < limit:
+                keys.append(self._names[i])
+                i += 1
+            i = bisect_left(self._words, (query,))
+            while i < len(self._words) and self._words[i][0].startswith(query) and len(keys) < limit:
+                if self._words[i][1] not in keys:
+                    keys.append(self._words[i][1])
+                i += 1
+            if not keys:
+                keys = difflib.get_close_matches(query, self._names, n=limit, cutoff=0.75)
+            if not keys:
+                for word in difflib.get_close_matches(query, list(self._by_word), n=limit, cutoff=0.75):
+                    keys.extend(key for key in self._by_word[word] if key not in keys)
+                keys = keys[:limit]
+            return [self._entry(key) for key in keys]
+
+    def match(self, name):
+        """The entry for exactly ``name`` if it is trustworthy enough to skip the model, else None."""
+        key = normalize_food_name(name)
+        with self._lock:
+            if key not in self._bundled and self._history.get(key, {}).get('samples', 0) < self.min_samples:
+                return None
+            return self._entry(key)
+
+    def record(self, analysis):
+        """Fold a complete AI analysis into the running averages for its meal."""
+        items = sorted(analysis['food_items'], key=str.lower)
+        key = normalize_food_name(", ".join(items))
+        if not key:
+            return
+        with self._lock:
+            entry = self._history.get(key)
+            if entry is None:
+                entry = dict.fromkeys(NUTRITION_FIELDS, 0.0)
+                entry.update(name=", ".join(items), serving=None, source='history', samples=0)
+                self._history[key] = entry
+                self._rebuild()
+            entry['samples'] += 1
+            for field in NUTRITION_FIELDS:
+                entry[field] += (analysis[field] - entry[field]) / entry['samples']
+            entry['balance_rating'] = analysis['balance_rating']
+            values = (key, entry['name'], *(entry[field] for field in NUTRITION_FIELDS),
+                      entry['balance_rating'], entry['samples'])
+        with self._db_lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO nutrition_history "
+                "(key, name, calories, protein, carbs, fat, balance_rating, samples) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                values
+            )
+
+@st.cache_resource
+def get_nutrition_index():
+    return NutritionIndex(NUTRITION_TABLE_PATH, NUTRITION_MIN_SAMPLES)
+
+def nutrition_analysis(entry):
+    """Present a nutrition index entry in the same shape as an AI food analysis."""
+    result = {'food_items': [entry['name']]}
+    # Calories feed integer inputs and logs, so only the macros keep a decimal
+    result.update((field, round(entry[field]) if field == 'calories' else round(entry[field], 1))
+                  for field in NUTRITION_FIELDS)
+    result['balance_rating'] = entry.get('balance_rating') or "Unknown"
+    result['suggestions'] = []
+    return result
+
+# AI Helper Functions
+class AIResources:
+    """Shared objects the AI job bodies use, resolved on the script thread.
+
+    Jobs run on worker threads without a script context, where the ``get_*``
+    resource functions cannot be called.
+    """
+
+    def __init__(self, model, metrics, parse_metrics, analysis_cache, advice_cache, nutrition_index):
+        self.model = model
+        self.metrics = metrics
+        self.parse_metrics = parse_metrics
+        self.analysis_cache = analysis_cache
+        self.advice_cache = advice_cache
+        self.nutrition_index = nutrition_index
+
+ANALYSIS_FALLBACK = {
+    "food_items": ["Food analysis failed"],
+    "calories": 0,
+    "protein": 0,
+    "carbs": 0,
+    "fat": 0,
+    "balance_rating": "Unknown",
+    "suggestions": ["Please try again or enter manually"]
+}
+
+FOOD_ANALYSIS_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "food_items": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "calories": {"type": "NUMBER"},
+        "protein": {"type": "NUMBER"},
+        "carbs": {"type": "NUMBER"},
+        "fat": {"type": "NUMBER"},
+        "balance_rating": {"type": "STRING", "enum": ["Poor", "Average", "Good", "Excellent"]},
+        "suggestions": {"type": "ARRAY", "items": {"type": "STRING"}}
+    },
+    "required": ["food_items", "calories", "protein", "carbs", "fat", "balance_rating", "suggestions"]
+}
+BALANCE_RATINGS = ("Poor", "Average", "Good", "Excellent")
+# Digits with optional thousands separators, decimals and exponent; a sign directly
+# in front is captured so negative amounts can be refused
+NUMBER_REGEX = r"(?:\d{1,3}(?:,\d{3})+(?!\d)|\d+)(?:\.\d+)?(?:[eE][-+]?\d+)?"
+NUMBER_PATTERN = re.compile(rf"([-\u2212])?({NUMBER_REGEX})")
+RANGE_PATTERN = re.compile(rf"({NUMBER_REGEX})\s*(?:-|\u2013|\u2014|to)\s*({NUMBER_REGEX})", re.IGNORECASE)
+
+class LenientJSONParser:
+    """Single-pass JSON reader that keeps whatever it parsed before the text broke off.
+
+    Accepts the usual model deviations: code fences and prose around the object,
+    single quotes, bare words, Python literals, trailing commas and truncation.
+    Valid JSON, the normal case in JSON mode, is handed to ``json.loads`` first.
+    """
+
+    _SCALARS = {'true': True, 'false': False, 'null': None, 'True': True, 'False': False, 'None': None}
+    _ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f'}
+    _HEX = frozenset('0123456789abcdefABCDEF')
+
+    def __init__(self, text):
+        self.text = text
+        self.pos = 0
+        self.depth = 0
+        self.complete = False
+
+    def parse(self):
+        start = self.text.find('{')
+        if start < 0:
+            return None
+        try:
+            parsed = json.loads(self.text[start:self.text.rfind('}') + 1])
+        except ValueError:
+            parsed = None
+        if isinstance(parsed, dict):
+            self.complete = True
+            return parsed
+        self.pos = start
+        return self._value()
+
+    def _skip(self):
+        while self.pos < len(self.text) and self.text[self.pos] in ' \t\r\n,':
+            self.pos += 1
+
+    def _value(self):
+        self._skip()
+        if self.pos >= len(self.text):
+            return None
+        char = self.text[self.pos]
+        if char == '{':
+            return self._container({}, '}')
+        if char == '[':
+            return self._container([], ']')
+        if char in '"\'':
+            return self._string()
+        return self._scalar()
+
+    def _container(self, result, close):
+        self.pos += 1
+        self.depth += 1
+        while True:
+            self._skip()
+            if self.pos >= len(self.text):
+                return result
+            if self.text[self.pos] == close:
+                self.pos += 1
+                self.depth -= 1
+                # Only an answer whose outermost object closed can be trusted in full
+                self.complete = self.depth == 0
+                return result
+            if isinstance(result, dict):
+                key = self._value()
+                self._skip()
+                if self.pos >= len(self.text) or self.text[self.pos] != ':':
+                    return result
+                self.pos += 1
+                if self.pos >= len(self.text):
+                    return result
+                result[str(key)] = self._value()
+            else:
+                start = self.pos
+                result.append(self._value())
+                if self.pos == start:
+                    # Unexpected character; skip it rather than loop
+                    self.pos += 1
+
+    def _string(self):
+        quote = self.text[self.pos]
+        self.pos += 1
+        if quote == '"':
+            try:
+                value, self.pos = json.decoder.scanstring(self.text, self.pos)
+                return value
+            except ValueError:
+                # Cut off or holding raw control characters; read it by hand below
+                pass
+        chars = []
+        while self.pos < len(self.text) and self.text[self.pos] != quote:
+            if self.text[self.pos] == '\\' and self.pos + 1 < len(self.text):
+                self.pos += 1
+                char = self.text[self.pos]
+                digits = self.text[self.pos + 1:self.pos + 5]
+                if char == 'u' and len(digits) == 4 and set(digits) <= self._HEX:
+                    chars.append(chr(int(digits, 16)))
+                    self.pos += 4
+                else:
+                    chars.append(self._ESCAPES.get(char, char))
+            else:
+                chars.append(self.text[self.pos])
+            self.pos += 1
+        self.pos += 1
+        return ''.join(chars)
+
+    def _scalar(self):
+        start = self.pos
+        while self.pos < len(self.text) and self.text[self.pos] not in ',:}]\n':
+            self.pos += 1
+        token = self.text[start:self.pos].strip()
+        if token in self._SCALARS:
+            return self._SCALARS[token]
+        try:
+            return float(token) if any(c in token for c in '.eE') else int(token)
+        except ValueError:
+            return token
+
+def to_number(value):
+    """Coerce model output such as ``"450 kcal"``, ``"~1,200g"`` or ``"400-500"`` to a number.
+
+    Only an explicit range (``"a-b"``, ``"a to b"``) is reduced to its midpoint; anything
+    else uses the first number. Negative and non-finite amounts give None.
+    """
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return value if math.isfinite(value) and value >= 0 else None
+    text = str(value)
+    match = NUMBER_PATTERN.search(text)
+    if match is None or match.group(1):
+        return None
+    span = RANGE_PATTERN.match(text, match.start(2))
+    values = [float(number.replace(',', '')) for number in (span.groups() if span else [match.group(2)])]
+    number = sum(values) / len(values)
+    if not math.isfinite(number):
+        return None
+    return int(number) if number.is_integer() else round(number, 1)
+
+def to_text_list(value):
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return [value] if value.strip() else []
+    return [str(item) for item in value if item not in (None, '')]
+
+def parse_food_analysis(text):
+    """Turn a model answer into ``(analysis, partial)``.
+
+    ``partial`` is True when fields had to be defaulted or the answer was cut off.
+    The analysis is None when the food items or the calories cannot be read.
+    """
+    parser = LenientJSONParser(text)
+    parsed = parser.parse()
+    if not isinstance(parsed, dict):
+        return None, True
+    result, missing = {}, []
+    for field, default in ANALYSIS_FALLBACK.items():
+        raw = parsed.get(field)
+        if field in ('food_items', 'suggestions'):
+            value = to_text_list(raw)
+            if field == 'food_items' and not value:
+                value = None
+        elif field == 'balance_rating':
+            value = next((rating for rating in BALANCE_RATINGS if str(raw).strip().lower() == rating.lower()), None)
+        else:
+            value = to_number(raw)
+        if value is None:
+            missing.append(field)
+            value = [] if field == 'suggestions' else "Unknown" if field == 'balance_rating' else 0
+        result[field] = value
+    if 'food_items' in missing or 'calories' in missing:
+        return None, True
+    return result, bool(missing) or not parser.complete
+
+class ParseMetrics:
+    """Counts how food analysis answers were parsed: cleanly, partially or not at all."""
+
+    OUTCOMES = ('parsed', 'partial', 'failed')
+
+    def __init__(self):
+        self._counts = dict.fromkeys(self.OUTCOMES, 0)
+        self._lock = threading.Lock()
+
+    def record(self, outcome):
+        with self._lock:
+            self._counts[outcome] += 1
+
+    def stats(self):
+        with self._lock:
+            counts = dict(self._counts)
+        total = sum(counts.values())
+        counts['failure_rate'] = counts['failed'] / total if total else 0.0
+        return counts
+
+@st.cache_resource
+def get_parse_metrics():
+    return ParseMetrics()
+
+def analyze_food_image(image, ai):
+    """Analyze food image using Gemini and return nutritional info and suggestions.
+
+    Answers missing some fields are returned with ``partial`` set to True.
+    """
     prompt = """
     You are a nutritionist analyzing a food photo. Perform these tasks:
     1. Identify the food items
@@ -137,24 +2081,75 @@ def analyze_food_image(image):
         "suggestions": [list of suggestions]
     }
     """
-    response = model.generate_content([prompt, image])
+    # JSON mode with a schema makes the model return exactly this shape
+    with track("gemini.analyze_food_image", ai.metrics) as call:
+        response = ai.model.generate_content(
+            [prompt, image],
+            generation_config={"response_mime_type": "application/json", "response_schema": FOOD_ANALYSIS_SCHEMA},
+            request_options={"timeout": GEMINI_TIMEOUT}
+        )
+        call['tokens'] = usage_tokens(response)
+    metrics = ai.parse_metrics
     try:
-        # Extract JSON from the response
-        response_text = response.text.replace('```json', '').replace('```', '').strip()
-        return eval(response_text)
-    except:
-        return {
-            "food_items": ["Food analysis failed"],
-            "calories": 0,
-            "protein": 0,
-            "carbs": 0,
-            "fat": 0,
-            "balance_rating": "Unknown",
-            "suggestions": ["Please try again or enter manually"]
-        }
+        text = response.text
+    except ValueError:
+        # Raised when the answer was blocked and has no text
+        metrics.record('failed')
+        return dict(ANALYSIS_FALLBACK)
+    result, partial = parse_food_analysis(text)
+    if result is None:
+        logger.warning("Unparseable food analysis answer: %.200r", text)
+        metrics.record('failed')
+        return dict(ANALYSIS_FALLBACK)
+    if partial:
+        metrics.record('partial')
+        result['partial'] = True
+    else:
+        metrics.record('parsed')
+    return result
 
-def get_pcod_advice(user_data):
-    """Get personalized PCOD advice based on user data."""
+def analyze_food_image_cached(image, ai):
+    """Return (analysis, from_cache), asking Gemini only for images not seen recently."""
+    key = image_fingerprint(image)
+    cached = ai.analysis_cache.get(key)
+    if cached is not None:
+        return cached, True
+    result = analyze_food_image(image, ai)
+    if result != ANALYSIS_FALLBACK and not result.get('partial'):
+        ai.analysis_cache.put(key, result)
+        ai.nutrition_index.record(result)
+    return result, False
+
+def analyze_food_image_with_retry(image, ai, attempts=GEMINI_MAX_ATTEMPTS, backoff=GEMINI_RETRY_BACKOFF):
+    """Cached analysis retried with exponential backoff; safe to call from worker threads."""
+    for attempt in range(attempts):
+        try:
+            return analyze_food_image_cached(image, ai)
+        except Exception:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(backoff * 2 ** attempt)
+
+def stream_model_text(prompt, site, ai):
+    """Yield Gemini's answer to ``prompt`` chunk by chunk as it is generated.
+
+    Time to the first chunk is recorded under ``<site>.first_chunk`` in addition to the
+    whole stream under ``site``.
+    """
+    with track(site, ai.metrics) as call:
+        started = time.perf_counter()
+        response = ai.model.generate_content(prompt, stream=True, request_options={"timeout": GEMINI_TIMEOUT})
+        for chunk in response:
+            # Chunks stopped by safety filters carry no parts
+            if chunk.parts:
+                if not call['size']:
+                    ai.metrics.observe(f"{site}.first_chunk", time.perf_counter() - started)
+                call['size'] += len(chunk.text.encode())
+                yield chunk.text
+        call['tokens'] = usage_tokens(response)
+
+def get_pcod_advice(user_data, ai):
+    """Stream personalized PCOD advice based on user data."""
     prompt = f"""
     You are a women's health specialist. A user with PCOD has provided this information:
     {user_data}
@@ -168,13 +2163,12 @@ def get_pcod_advice(user_data):
     
     Format your response with clear headings and bullet points.
     """
-    response = model.generate_content(prompt)
-    return response.text
+    return stream_model_text(prompt, "gemini.get_pcod_advice", ai)
 
-def get_health_insights(health_data):
-    """Get health insights based on logged metrics."""
+def get_health_insights(health_data, ai):
+    """Stream health insights based on logged metrics."""
     prompt = f"""
-    Analyze this health data and provide personalized recommendations:
+    Analyze this summary of logged health data and provide personalized recommendations:
     {health_data}
     
     Focus on:
@@ -186,8 +2180,250 @@ def get_health_insights(health_data):
     
     Format as bullet points with emojis for readability.
     """
-    response = model.generate_content(prompt)
-    return response.text
+    return stream_model_text(prompt, "gemini.get_health_insights", ai)
+
+def bmi_band(bmi):
+    if bmi < 18.5:
+        return "Underweight"
+    if bmi < 25:
+        return "Healthy"
+    if bmi < 30:
+        return "Overweight"
+    return "Obese"
+
+def canonical_pcod_profile(user_data):
+    """Reduce PCOD advice input to the fields the advice depends on, in a stable form.
+
+    Exact weight, height and calorie numbers become a BMI band and a net calorie
+    bucket, and list order is dropped, so near-identical profiles share one key.
+    """
+    profile = user_data['profile']
+    bmi = profile['weight'] / ((profile['height'] / 100) ** 2)
+    net = user_data['calorie_balance']['net']
+    return {
+        'diagnosed': profile['diagnosed'],
+        'bmi_band': bmi_band(bmi),
+        'symptoms': sorted(profile['symptoms']),
+        'goals': sorted(profile['goals']),
+        'net_calories': round(net / ADVICE_CALORIE_BUCKET) * ADVICE_CALORIE_BUCKET
+    }
+
+def pcod_advice_key(profile):
+    return hashlib.sha256(json.dumps(profile, sort_keys=True).encode()).hexdigest()
+
+def get_pcod_advice_cached(user_data, ai):
+    """Return (chunks, from_cache), generating advice only for canonical profiles not seen recently.
+
+    Advice is cached across users; only completed answers are stored.
+    """
+    cache = ai.advice_cache
+    profile = canonical_pcod_profile(user_data)
+    key = pcod_advice_key(profile)
+    cached = cache.get(key)
+    if cached is not None:
+        return iter([cached]), True
+
+    def stream_and_store():
+        text = ''
+        for chunk in get_pcod_advice(profile, ai):
+            text += chunk
+            yield chunk
+        if text:
+            cache.put(key, text)
+
+    return stream_and_store(), False
+
+class AIJob:
+    """Handle for one background model call; ``text`` grows while a streamed answer arrives."""
+
+    ACTIVE = ('queued', 'running')
+
+    def __init__(self, key, user_id):
+        self.id = uuid.uuid4().hex
+        self.key = key
+        self.user_id = user_id
+        self.status = 'queued'
+        # Cleared by job bodies whose result should not be handed to later submissions
+        self.reusable = True
+        self.text = ''
+        self.result = None
+        self.error = None
+        self.started_at = None
+        self.finished_at = None
+        # Sessions still waiting for the result; the job is only cancelled once all stop
+        self.subscribers = set()
+        self.cancelled = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status not in self.ACTIVE
+
+    @property
+    def elapsed(self):
+        return (self.finished_at or time.monotonic()) - (self.started_at or time.monotonic())
+
+class AIJobQueue:
+    """Process-wide executor for model calls that outlive the rerun that started them.
+
+    Submitting work with the same key as a queued, running or recently finished job
+    returns that job instead of calling the model again, unless it failed, was
+    cancelled or marked itself not reusable. Jobs are shared across users, so each
+    submitter is tracked as a subscriber and ``cancel`` only stops a job nobody else
+    still waits for. Each user may have at most ``per_user`` jobs queued or running at
+    once, unless the submission passes its own ``limit``. Job bodies are handed the
+    queue's AIResources.
+    """
+
+    def __init__(self, max_workers, per_user, result_ttl, resources):
+        self.max_workers = max_workers
+        self.per_user = per_user
+        self.result_ttl = result_ttl
+        self.resources = resources
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="wellher-ai")
+        self._jobs = {}
+        self._by_key = {}
+        self._lock = threading.Lock()
+
+    def submit(self, user_id, key, fn, *args, subscriber=None, limit=None):
+        """Run ``fn(job, resources, *args)`` in the background; returns the job, or None if the user is at their limit.
+
+        ``subscriber`` identifies the session waiting for the result and defaults to the user.
+        ``limit`` replaces ``per_user`` as the number of jobs the user may have active.
+        """
+        subscriber = subscriber or user_id
+        with self._lock:
+            self._expire()
+            job = self._by_key.get(key)
+            if (job is not None and job.status not in ('failed', 'cancelled') and job.reusable
+                    and not job.cancelled.is_set()):
+                job.subscribers.add(subscriber)
+                return job
+            active = sum(1 for job in self._jobs.values() if job.user_id == user_id and not job.finished)
+            if active >= (limit or self.per_user):
+                return None
+            job = AIJob(key, user_id)
+            job.subscribers.add(subscriber)
+            self._jobs[job.id] = self._by_key[key] = job
+        self._pool.submit(self._run, job, fn, args)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id, subscriber):
+        """Stop waiting for a job; returns True if that cancelled it, False if others still wait."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return False
+            job.subscribers.discard(subscriber)
+            if job.subscribers:
+                return False
+            job.cancelled.set()
+            return True
+
+    def _run(self, job, fn, args):
+        job.started_at = time.monotonic()
+        if job.cancelled.is_set():
+            job.status = 'cancelled'
+        else:
+            job.status = 'running'
+            try:
+                job.result = fn(job, self.resources, *args)
+                job.status = 'cancelled' if job.cancelled.is_set() else 'done'
+            except Exception as e:
+                logger.exception("AI job %s failed", job.key[0])
+                job.error = str(e)
+                job.status = 'failed'
+        job.finished_at = time.monotonic()
+
+    def _expire(self):
+        now = time.monotonic()
+        for job in [job for job in self._jobs.values() if job.finished and now - job.finished_at > self.result_ttl]:
+            del self._jobs[job.id]
+            if self._by_key.get(job.key) is job:
+                del self._by_key[job.key]
+
+@st.cache_resource
+def get_ai_jobs():
+    resources = AIResources(get_model(), get_metrics(), get_parse_metrics(), get_analysis_cache(),
+                            get_advice_cache(), get_nutrition_index())
+    return AIJobQueue(AI_MAX_WORKERS, AI_JOBS_PER_USER, AI_JOB_RESULT_TTL, resources)
+
+def stream_into(job, chunks):
+    """Job body for streamed answers: append chunks to ``job.text`` until done or cancelled."""
+    for chunk in chunks:
+        if job.cancelled.is_set():
+            break
+        job.text += chunk
+    return job.text
+
+def run_food_analysis(job, ai, image):
+    result, from_cache = analyze_food_image_with_retry(image, ai)
+    if result == ANALYSIS_FALLBACK:
+        raise ValueError("the AI answer could not be read, please try again or enter the meal manually")
+    # Partial answers are not cached either, so asking again may get a complete one
+    job.reusable = not result.get('partial')
+    return result, from_cache
+
+def run_pcod_advice(job, ai, user_data):
+    chunks, from_cache = get_pcod_advice_cached(user_data, ai)
+    stream_into(job, chunks)
+    return from_cache
+
+def run_health_insights(job, ai, context):
+    return stream_into(job, get_health_insights(context, ai))
+
+def submit_ai_job(name, key, fn, *args):
+    """Start (or join) a background job and keep its handle under ``name`` in session state."""
+    job = get_ai_jobs().submit(st.session_state.user_id, key, fn, *args, subscriber=st.session_state.job_subscriber)
+    if job is None:
+        st.warning("You already have AI requests running. Please wait for them to finish.")
+        return None
+    st.session_state.jobs[name] = job.id
+    return job
+
+def current_job(name):
+    job_id = st.session_state.jobs.get(name)
+    return get_ai_jobs().get(job_id) if job_id else None
+
+def render_ai_job(name, render_result):
+    """Show the session's ``name`` job: progress while it runs, then ``render_result(job)``.
+
+    While the job is active only a fragment polling every AI_JOB_POLL_INTERVAL seconds
+    reruns; once the job finishes the whole page reruns so results reach the rest of it.
+    """
+    job = current_job(name)
+    if job is None:
+        return
+    if job.finished:
+        render_result(job)
+        return
+
+    @st.fragment(run_every=AI_JOB_POLL_INTERVAL)
+    def poll():
+        if job.finished:
+            st.rerun()
+        if job.text:
+            st.markdown(job.text + "▌")
+        else:
+            st.caption("Waiting for the AI..." if job.status == 'queued' else "The AI is working on it...")
+        if st.button("Stop", key=f"stop_{name}"):
+            if not get_ai_jobs().cancel(job.id, st.session_state.job_subscriber):
+                # Another session still wants this answer; only stop following it here
+                del st.session_state.jobs[name]
+                st.rerun()
+
+    poll()
+
+def render_text_result(job):
+    if job.status == 'failed':
+        st.error(f"The AI request failed: {job.error}")
+        return
+    st.markdown(job.text)
+    if job.status == 'cancelled':
+        st.caption("Generation was stopped before it finished; showing the partial answer.")
 
 # Authentication UI
 def show_auth():
@@ -203,13 +2439,15 @@ def show_auth():
             password = st.text_input("Password", type="password")
             
             if st.form_submit_button("Login"):
-                if verify_user(username, password):
+                if get_auth_service().limited(username):
+                    st.error("Too many failed attempts. Please wait a few minutes and try again.")
+                elif verify_user(username, password):
                     st.session_state.authenticated = True
                     st.session_state.user_id = username
                     # Load user data
                     health_data = load_user_data('health_logs')
                     if health_data:
-                        st.session_state.health_logs = pd.DataFrame(health_data)
+                        st.session_state.health_logs = HealthLogStore.from_rows(health_data)
                     st.rerun()
                 else:
                     st.error("Invalid username or password")
@@ -232,8 +2470,9 @@ def show_auth():
                     else:
                         st.error("Username already exists")
 
-# Main App Pages (unchanged from your original code)
+# Main App Pages
 def render_health_dashboard():
+    import pandas as pd
     st.title(f"🌸 Welcome back, {st.session_state.user_id}!")
     st.markdown("""
     <div class="welcome-box">
@@ -252,112 +2491,147 @@ def render_health_dashboard():
     
     # Health Summary
     if not st.session_state.health_logs.empty:
-        latest_log = st.session_state.health_logs.iloc[-1]
+        latest_log = st.session_state.health_logs.latest()
         st.subheader("Latest Health Metrics")
         col1, col2, col3 = st.columns(3)
-        col1.metric("Blood Pressure", f"{latest_log['blood_pressure']} mmHg", 
-                   "Normal" if latest_log['blood_pressure'] <= 120 else "Elevated")
-        col2.metric("Sugar Level", f"{latest_log['sugar_level']} mg/dL", 
-                   "Normal" if latest_log['sugar_level'] <= 100 else "High")
-        col3.metric("Cholesterol", f"{latest_log['cholesterol']} mg/dL", 
-                   "Normal" if latest_log['cholesterol'] <= 200 else "High")
+        col1.metric("Blood Pressure", f"{latest_log['blood_pressure']:g} mmHg", 
+                   "Normal" if latest_log['blood_pressure'] <= HEALTH_LIMITS['blood_pressure'] else "Elevated")
+        col2.metric("Sugar Level", f"{latest_log['sugar_level']:g} mg/dL", 
+                   "Normal" if latest_log['sugar_level'] <= HEALTH_LIMITS['sugar_level'] else "High")
+        col3.metric("Cholesterol", f"{latest_log['cholesterol']:g} mg/dL", 
+                   "Normal" if latest_log['cholesterol'] <= HEALTH_LIMITS['cholesterol'] else "High")
     
     # Health Trend Visualization
     if len(st.session_state.health_logs) > 1:
         st.subheader("Health Trends")
-        fig = px.line(st.session_state.health_logs, x='Date', y=['Blood Pressure', 'Sugar Level', 'Cholesterol'],
-                     markers=True, title="Your Health Metrics Over Time")
+        # Narrower windows are downsampled less, so zooming in loads more detail
+        window = st.select_slider("Time window", options=list(CHART_WINDOWS), value="1 year")
+        fig = health_trend_figure(st.session_state.health_logs, CHART_WINDOWS[window])
         st.plotly_chart(fig, use_container_width=True)
+    
+    # Weekly Health Summary
+    weeks = [
+        (key, bucket)
+        for key, bucket in load_rollups('health_logs').window(st.session_state.user_id, 'health_logs', 'week', 4)
+        if bucket
+    ]
+    if weeks:
+        st.subheader("Weekly Health Summary")
+        summary = []
+        for key, bucket in weeks:
+            row = {'Week of': key}
+            for name in HEALTH_METRICS:
+                if f"{name}_mean" in bucket:
+                    row[f"{HEALTH_LABELS[name]} (avg)"] = round(bucket[f"{name}_mean"], 1)
+                    row[f"{HEALTH_LABELS[name]} (range)"] = f"{bucket[f'{name}_min']:g}–{bucket[f'{name}_max']:g}"
+            summary.append(row)
+        st.dataframe(pd.DataFrame(summary), hide_index=True)
 
 
 def render_calorie_dashboard():
+    import pandas as pd
     st.title("🍽️ Calorie Log History")
+    user_id = st.session_state.user_id
 
-    # Fetch food logs from Supabase for the current user
-    food_logs = load_user_data('food_logs')
+    # Fold any new food and exercise logs into the rollups
+    rollups = load_rollups('food_logs', 'calorie_tracking')
 
-    if not food_logs or len(food_logs) == 0:
+    if not rollups.count(user_id, 'food_logs'):
         st.info("No food logs found.")
         return
 
-    # Convert to DataFrame for display
-    df = pd.DataFrame(food_logs)
-
-    # Try to parse date/time for sorting if available
-    if 'logged_at' in df.columns:
-        df['logged_at'] = pd.to_datetime(df['logged_at'])
-        df = df.sort_values(by='logged_at', ascending=False)
-
     st.subheader("Your Food & Calorie History")
-    st.dataframe(df, hide_index=True)
+    col1, col2 = st.columns(2)
+    period = col1.radio("Group by", ["day", "week"], horizontal=True)
+    span = col2.slider("Periods shown", 1, 90, 14)
+    intake = rollups.window(user_id, 'food_logs', period, span)
+    burned = rollups.window(user_id, 'calorie_tracking', period, span)
+    summary = pd.DataFrame({
+        period.title(): [key for key, _ in intake],
+        'Meals': [bucket.get('meals', 0) for _, bucket in intake],
+        'Calories In': [bucket.get('calories_in', 0) for _, bucket in intake],
+        'Calories Out': [bucket.get('calories_out', 0) for _, bucket in burned]
+    })
+    summary['Net'] = summary['Calories In'] - summary['Calories Out']
+    st.dataframe(summary, hide_index=True)
+
+    st.metric("Total Calories Logged", f"{rollups.total(user_id, 'food_logs')} kcal")
 
-    # Show summary statistics if columns exist
-    if 'calories' in df.columns:
-        total_calories = df['calories'].sum()
-        st.metric("Total Calories Logged", f"{total_calories} kcal")
+    # Rows are kept in logged_at order, so the latest meals are at the end
+    st.subheader("Most Recent Meals")
+    recent = pd.DataFrame(load_user_data('food_logs')[-10:][::-1])
+    st.write(recent[[column for column in ('logged_at', 'food', 'calories') if column in recent.columns]])
 
-    if 'food_name' in df.columns and 'logged_at' in df.columns:
-        st.subheader("Most Recent Meals")
-        st.write(df[['logged_at', 'food_name', 'calories']].head(10))
-    elif 'food' in df.columns and 'logged_at' in df.columns:
-        st.subheader("Most Recent Meals")
-        st.write(df[['logged_at', 'food', 'calories']].head(10))
+    if st.checkbox("Show every logged meal"):
+        df = load_user_frame('food_logs')
+        if 'logged_at' in df.columns:
+            df = df.assign(logged_at=pd.to_datetime(df['logged_at'])).sort_values(by='logged_at', ascending=False)
+        st.dataframe(df, hide_index=True)
 
 def render_food_analysis():
+    import pandas as pd
     st.title("📷 AI Food Analysis")
     st.markdown("Take a photo of your meal and get instant nutritional analysis")
     
     # Food photo input
-    uploaded_file = st.file_uploader("Upload Food Photo", type=["jpg", "jpeg", "png"])
+    uploaded_files = st.file_uploader("Upload Food Photos", type=["jpg", "jpeg", "png"], accept_multiple_files=True)
+    uploaded_file = uploaded_files[0] if len(uploaded_files) == 1 else None
     col1, col2 = st.columns(2)
-    analysis_result = None
+    # Forget prepared images once their files are removed from the uploader
+    current = {f.file_id for f in uploaded_files}
+    for file_id in [file_id for file_id in st.session_state.prepared_uploads if file_id not in current]:
+        del st.session_state.prepared_uploads[file_id]
+    batch = st.session_state.food_batch
+    if batch is not None and [item['file_id'] for item in batch['items']] != [f.file_id for f in uploaded_files]:
+        st.session_state.food_batch = None
+    
+    if len(uploaded_files) > 1:
+        render_batch_food_analysis(uploaded_files)
     
     if uploaded_file is not None:
-        image = Image.open(uploaded_file)
+        image, upload_stats, fingerprint = prepared_upload(uploaded_file)
         col1.image(image, caption="Your Meal", width=300)
+        col1.caption(
+            f"Upload reduced from {upload_stats['bytes_before'] / 1024:.0f} KB "
+            f"to {upload_stats['bytes_after'] / 1024:.0f} KB"
+        )
         
+        meal_name = col2.text_input("What is it? (optional)", help="Known foods are looked up locally instead of asking the AI")
         if col2.button("Analyze with AI"):
-            with st.spinner("AI is analyzing your meal..."):
-                analysis_result = analyze_food_image(image)
-                
-            if analysis_result:
-                st.success("Analysis Complete!")
-                
-                # Display results
-                col1, col2, col3, col4 = st.columns(4)
-                col1.metric("Calories", analysis_result['calories'])
-                col2.metric("Protein", f"{analysis_result['protein']}g")
-                col3.metric("Carbs", f"{analysis_result['carbs']}g")
-                col4.metric("Fat", f"{analysis_result['fat']}g")
-                
-                st.subheader("Meal Balance")
-                rating = analysis_result['balance_rating']
-                color = "red" if rating == "Poor" else "orange" if rating == "Average" else "green" if rating == "Good" else "blue"
-                st.markdown(f"<div class='rating-badge {color}'>{rating}</div>", unsafe_allow_html=True)
-                
-                st.subheader("Improvement Suggestions")
-                for suggestion in analysis_result['suggestions']:
-                    st.markdown(f"- {suggestion}")
-                
-                # Save to session and database
-                st.session_state.calorie_data['intake'] += analysis_result['calories']
-                food_entry = {
-                    'time': datetime.datetime.now().strftime("%H:%M"),
-                    'food': ", ".join(analysis_result['food_items']),
-                    'calories': analysis_result['calories']
-                }
-                st.session_state.food_logs.append(food_entry)
-                save_user_data('food_logs', food_entry)
+            known = get_nutrition_index().match(meal_name) if meal_name else None
+            if known is not None:
+                show_food_analysis(nutrition_analysis(known), 'Matched in nutrition index', 0.0, uuid.uuid4().hex)
+            else:
+                submit_ai_job('food_analysis', ('food_analysis', fingerprint), run_food_analysis, image)
+        
+        # Results of an earlier photo are not shown under a new one
+        job = current_job('food_analysis')
+        if job is not None and job.key == ('food_analysis', fingerprint):
+            render_ai_job('food_analysis', render_food_job)
     
     # Manual calorie entry
     with st.expander("Or enter manually"):
         food_name = st.text_input("Food Name")
-        calories = st.number_input("Calories", min_value=0, value=300)
+        matches = get_nutrition_index().search(food_name) if food_name else []
+        match = None
+        if matches:
+            labels = [
+                f"{entry['name']} · {entry['calories']:.0f} kcal" + (f" per {entry['serving']}" if entry['serving'] else "")
+                for entry in matches
+            ]
+            choice = st.selectbox("Matching foods", ["Use the name as typed"] + labels)
+            if choice in labels:
+                match = matches[labels.index(choice)]
+        # Keying on the match resets the default whenever a different food is picked
+        calories = st.number_input(
+            "Calories", min_value=0, value=round(match['calories']) if match else 300,
+            key=f"manual_calories_{match['key'] if match else ''}"
+        )
         if st.button("Add to Daily Log"):
             st.session_state.calorie_data['intake'] += calories
             food_entry = {
                 'time': datetime.datetime.now().strftime("%H:%M"),
-                'food': food_name,
+                'food': match['name'] if match else food_name,
                 'calories': calories
             }
             st.session_state.food_logs.append(food_entry)
@@ -370,6 +2644,160 @@ def render_food_analysis():
         food_df = pd.DataFrame(st.session_state.food_logs)
         st.dataframe(food_df, hide_index=True)
 
+def render_food_job(job):
+    if job.status == 'failed':
+        st.error(f"Analysis failed: {job.error}")
+        return
+    if job.status == 'cancelled':
+        return
+    analysis_result, from_cache = job.result
+    source = 'Served from analysis cache' if from_cache else 'Fresh AI analysis'
+    show_food_analysis(analysis_result, source, job.elapsed, job.id)
+
+def show_food_analysis(analysis_result, source, elapsed, entry_id):
+    """Display an analysis and log it once per session under ``entry_id``."""
+    st.success("Analysis Complete!")
+    cache_stats = get_analysis_cache().stats()
+    parse_stats = get_parse_metrics().stats()
+    st.caption(
+        f"{source} in {elapsed:.2f}s · "
+        f"cache hit rate {cache_stats['hit_rate']:.0%} over {cache_stats['hits'] + cache_stats['misses']} lookups · "
+        f"unreadable answers {parse_stats['failure_rate']:.0%}"
+    )
+    partial = analysis_result.get('partial')
+    if partial:
+        st.warning("Part of the AI answer could not be read; missing values are shown as 0.")
+    
+    # Display results
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Calories", analysis_result['calories'])
+    col2.metric("Protein", f"{analysis_result['protein']}g")
+    col3.metric("Carbs", f"{analysis_result['carbs']}g")
+    col4.metric("Fat", f"{analysis_result['fat']}g")
+    
+    st.subheader("Meal Balance")
+    rating = analysis_result['balance_rating']
+    color = "red" if rating == "Poor" else "orange" if rating == "Average" else "green" if rating == "Good" else "blue"
+    st.markdown(f"<div class='rating-badge {color}'>{rating}</div>", unsafe_allow_html=True)
+    
+    st.subheader("Improvement Suggestions")
+    for suggestion in analysis_result['suggestions']:
+        st.markdown(f"- {suggestion}")
+    
+    # Save to session and database; partial answers only once the user confirms them
+    if entry_id in st.session_state.saved_jobs:
+        return
+    if partial and not st.button("Add to Daily Log anyway", key=f"log_{entry_id}"):
+        return
+    st.session_state.saved_jobs.add(entry_id)
+    st.session_state.calorie_data['intake'] += analysis_result['calories']
+    food_entry = {
+        'time': datetime.datetime.now().strftime("%H:%M"),
+        'food': ", ".join(analysis_result['food_items']),
+        'calories': analysis_result['calories']
+    }
+    st.session_state.food_logs.append(food_entry)
+    save_user_data('food_logs', food_entry)
+
+def render_batch_food_analysis(uploaded_files):
+    """Analyze several photos as one job per photo on the shared AI queue.
+
+    A batch may run up to AI_BATCH_PER_USER photos at once, so small batches take
+    about one model call's latency while the remaining workers stay free for other
+    users; larger batches are submitted as earlier photos finish. A fragment polls
+    until all are done, then the meals are logged once.
+    """
+    st.caption(f"{len(uploaded_files)} photos selected")
+    if st.button("Analyze all with AI"):
+        items = []
+        for uploaded_file in uploaded_files:
+            image, _, fingerprint = prepared_upload(uploaded_file)
+            items.append({
+                'name': uploaded_file.name, 'file_id': uploaded_file.file_id, 'image': image,
+                'key': ('food_analysis', fingerprint), 'job': None, 'done': False, 'result': None, 'error': None,
+            })
+        st.session_state.food_batch = {'items': items, 'added': None}
+    batch = st.session_state.food_batch
+    if batch is None:
+        return
+    
+    if advance_food_batch(batch):
+        render_food_batch(batch)
+        if batch['added'] is None:
+            save_food_batch(batch)
+        if batch['added']:
+            st.success(f"Added {batch['added']} meals to your log!")
+        return
+    
+    @st.fragment(run_every=AI_JOB_POLL_INTERVAL)
+    def poll():
+        if advance_food_batch(batch):
+            st.rerun()
+        render_food_batch(batch)
+    
+    poll()
+
+def advance_food_batch(batch):
+    """Collect finished photos and submit waiting ones while the batch has free job slots.
+
+    Returns True once every photo has finished.
+    """
+    jobs = get_ai_jobs()
+    for item in batch['items']:
+        if item['done']:
+            continue
+        job = jobs.get(item['job']) if item['job'] else None
+        if job is None:
+            job = jobs.submit(st.session_state.user_id, item['key'], run_food_analysis, item['image'],
+                              subscriber=st.session_state.job_subscriber, limit=AI_BATCH_PER_USER)
+            if job is None:
+                # At the batch limit; later photos wait for the next poll
+                break
+            item['job'] = job.id
+        if job.finished:
+            item['done'] = True
+            if job.status == 'done':
+                item['result'] = job.result[0]
+            else:
+                item['error'] = job.error or "stopped"
+    return all(item['done'] for item in batch['items'])
+
+def render_food_batch(batch):
+    done = sum(item['done'] for item in batch['items'])
+    total = len(batch['items'])
+    st.progress(done / total, text=f"Analyzed {done}/{total} meals" if done == total else f"Analyzing {done}/{total} meals...")
+    for item in batch['items']:
+        if not item['done']:
+            continue
+        result = item['result']
+        col1, col2 = st.columns([1, 3])
+        col1.image(item['image'], width=120)
+        if result is None or result.get('partial'):
+            col2.markdown(f"**{item['name']}** — could not be analyzed, please enter it manually")
+            if item['error']:
+                col2.caption(item['error'])
+        else:
+            col2.markdown(f"**{', '.join(result['food_items'])}**")
+            col2.caption(
+                f"{result['calories']} kcal · {result['protein']}g protein · "
+                f"{result['carbs']}g carbs · {result['fat']}g fat · {result['balance_rating']}"
+            )
+
+def save_food_batch(batch):
+    food_entries = [
+        {
+            'time': datetime.datetime.now().strftime("%H:%M"),
+            'food': ", ".join(item['result']['food_items']),
+            'calories': item['result']['calories']
+        }
+        for item in batch['items'] if item['result'] is not None and not item['result'].get('partial')
+    ]
+    batch['added'] = len(food_entries)
+    if food_entries:
+        st.session_state.calorie_data['intake'] += sum(entry['calories'] for entry in food_entries)
+        st.session_state.food_logs.extend(food_entries)
+        save_user_rows('food_logs', food_entries)
+
 def render_pcod_assistant():
     st.title("🌸 PCOD Reversal Assistant")
     
@@ -434,10 +2862,21 @@ def render_pcod_assistant():
                 }
             }
             
-            with st.spinner("Generating personalized advice..."):
-                advice = get_pcod_advice(user_data)
-                st.markdown("### 🧠 Your Personalized PCOD Plan")
-                st.markdown(advice)
+            key = ('pcod_advice', pcod_advice_key(canonical_pcod_profile(user_data)))
+            submit_ai_job('pcod_advice', key, run_pcod_advice, user_data)
+        
+        if current_job('pcod_advice') is not None:
+            st.markdown("### 🧠 Your Personalized PCOD Plan")
+            render_ai_job('pcod_advice', render_advice_result)
+
+def render_advice_result(job):
+    render_text_result(job)
+    if job.status == 'done':
+        cache_stats = get_advice_cache().stats()
+        st.caption(
+            f"{'Served from advice cache' if job.result else 'Fresh AI advice'} · "
+            f"cache hit rate {cache_stats['hit_rate']:.0%} over {cache_stats['hits'] + cache_stats['misses']} lookups"
+        )
 
 def render_health_logs():
     st.title("📊 Health Logs")
@@ -457,34 +2896,87 @@ def render_health_logs():
         
         if submitted:
             new_log = {
-                'Date': datetime.datetime.now().strftime("%Y-%m-%d %H:%M"),
-                'Blood Pressure': bp,
-                'Sugar Level': sugar,
-                'Cholesterol': cholesterol
-            }
-            st.session_state.health_logs = pd.concat(
-                [st.session_state.health_logs, pd.DataFrame([new_log])],
-                ignore_index=True
-            )
-            save_user_data('health_logs', {
                 'blood_pressure': bp,
                 'sugar_level': sugar,
                 'cholesterol': cholesterol,
-                'date': new_log['Date']
-            })
+                'date': datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+            }
+            st.session_state.health_logs.append(new_log['date'], bp, sugar, cholesterol)
+            save_user_data('health_logs', new_log)
             st.success("Health metrics logged!")
     
     # View History
     if not st.session_state.health_logs.empty:
         st.subheader("Health History")
-        st.dataframe(st.session_state.health_logs)
+        st.dataframe(st.session_state.health_logs.frame(HEALTH_LABELS))
         
         # Get AI Insights
         if st.button("Get Health Insights"):
-            with st.spinner("Analyzing your health data..."):
-                insights = get_health_insights(st.session_state.health_logs.to_dict())
-                st.markdown("### 🩺 AI Health Analysis")
-                st.markdown(insights)
+            context = health_context().build()
+            st.caption(f"Summarized {len(st.session_state.health_logs)} readings into about {estimate_tokens(context)} tokens")
+            key = ('health_insights', hashlib.sha256(context.encode()).hexdigest())
+            submit_ai_job('health_insights', key, run_health_insights, context)
+        
+        if current_job('health_insights') is not None:
+            st.markdown("### 🩺 AI Health Analysis")
+            render_ai_job('health_insights', render_text_result)
+
+TRANSFER_TABLES = {"Food logs": 'food_logs', "Health logs": 'health_logs'}
+
+def render_data_transfer():
+    st.title("🔁 Import & Export")
+
+    # Import
+    st.subheader("Import History")
+    st.markdown("Upload a CSV or Parquet file with one row per entry. Rows whose `logged_at` is already in your log are skipped.")
+    label = st.selectbox("Import into", list(TRANSFER_TABLES), key="import_table")
+    table = TRANSFER_TABLES[label]
+    required = [name for name in TRANSFER_COLUMNS[table] if name not in TRANSFER_DERIVED]
+    st.caption(f"Required columns: {', '.join(required)}")
+    uploaded_file = st.file_uploader("History file", type=["csv", "parquet"])
+    if uploaded_file is not None and st.button("Import"):
+        try:
+            with st.spinner("Importing..."):
+                stats = import_user_rows(table, uploaded_file)
+            st.success(
+                f"Imported {stats['imported']} rows · skipped {stats['duplicates']} already logged · "
+                f"rejected {stats['rejected']} invalid"
+            )
+        except Exception as e:
+            st.error(f"Import failed: {str(e)}. Rows imported so far are kept; importing the file again skips them.")
+
+    # Export
+    st.subheader("Export History")
+    label = st.selectbox("Export", list(TRANSFER_TABLES), key="export_table")
+    fmt = st.radio("Format", ["csv", "parquet"], horizontal=True, format_func=str.upper)
+    table, user_id = TRANSFER_TABLES[label], st.session_state.user_id
+    # The file is only built when the button is clicked
+    st.download_button(
+        f"Download {label.lower()}", lambda: export_user_rows(table, user_id, fmt),
+        file_name=f"wellher_{table}.{fmt}",
+        mime="text/csv" if fmt == 'csv' else "application/vnd.apache.parquet"
+    )
+
+def render_metrics():
+    import pandas as pd
+    st.title("⏱️ Call Metrics")
+    metrics = get_metrics()
+    summary = metrics.summary()
+    if not summary:
+        st.info("No calls recorded yet.")
+        return
+    
+    st.subheader("Latency by Call Site")
+    st.caption("Percentiles are the upper bounds of histogram buckets.")
+    st.dataframe(pd.DataFrame(summary).round(3), hide_index=True)
+    
+    st.subheader("Recent Calls")
+    events = pd.DataFrame(metrics.events(), columns=['at', 'site', 'seconds', 'error', 'bytes', 'tokens'])
+    events['at'] = pd.to_datetime(events['at'], unit='s')
+    st.dataframe(events.iloc[::-1].head(200), hide_index=True)
+    
+    st.download_button("Download Prometheus metrics", metrics.prometheus(), file_name="wellher_metrics.prom",
+                       mime="text/plain")
 
 # Main App Flow
 def main():
@@ -493,24 +2985,35 @@ def main():
     else:
         # Sidebar Navigation
         st.sidebar.title(f"🌸 {st.session_state.user_id}")
-        menu = ["Health Dashboard", "Food Analysis", "PCOD Assistant", "Health Logs"]
+        menu = ["Health Dashboard", "Food Analysis", "PCOD Assistant", "Health Logs", "Import & Export"]
+        if st.session_state.user_id in ADMIN_USERS:
+            menu.append("Metrics")
         choice = st.sidebar.selectbox("Menu", menu)
         
         # Add logout button
         if st.sidebar.button("Logout"):
+            # Flushed in the background so logging out never waits on Supabase
+            get_write_queue().wake()
+            get_read_cache().invalidate(st.session_state.user_id)
+            get_rollups().invalidate(st.session_state.user_id)
             st.session_state.clear()
             st.rerun()
         
         # Page routing
-        if choice == "Health Dashboard":
-            render_health_dashboard()
-            render_calorie_dashboard()
-        elif choice == "Food Analysis":
-            render_food_analysis()
-        elif choice == "PCOD Assistant":
-            render_pcod_assistant()
-        elif choice == "Health Logs":
-            render_health_logs()
+        with track(f"page:{choice}"):
+            if choice == "Health Dashboard":
+                render_health_dashboard()
+                render_calorie_dashboard()
+            elif choice == "Food Analysis":
+                render_food_analysis()
+            elif choice == "PCOD Assistant":
+                render_pcod_assistant()
+            elif choice == "Health Logs":
+                render_health_logs()
+            elif choice == "Import & Export":
+                render_data_transfer()
+            elif choice == "Metrics":
+                render_metrics()
         
         # Sidebar additional features
         st.sidebar.markdown("---")
@@ -527,6 +3030,10 @@ def main():
             st.session_state.calorie_data['burned'] += calories_burned
             save_user_data('calorie_tracking', st.session_state.calorie_data)
             st.sidebar.success(f"Added {calories_burned} kcal burned!")
+    
+    record_timing('rerun', RERUN_STARTED, logging.DEBUG)
+    if SHOW_TIMINGS:
+        st.sidebar.caption(f"Startup timings: {startup_report()}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
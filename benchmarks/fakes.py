@@ -0,0 +1,288 @@
+"""Local stand-ins for the Supabase client and the Gemini model.
+
+app.py picks these up through ``WELLHER_SUPABASE_FACTORY=benchmarks.fakes:FakeSupabase``
+and ``WELLHER_MODEL_FACTORY=benchmarks.fakes:FakeModel``. Both read their settings from
+the environment, since the app builds them without arguments.
+"""
+
+import datetime
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from types import SimpleNamespace
+
+FAKE_SUPABASE_DB = os.getenv("FAKE_SUPABASE_DB", "fake_supabase.db")
+FAKE_SUPABASE_LATENCY = float(os.getenv("FAKE_SUPABASE_LATENCY", 0.02))
+FAKE_GEMINI_FIRST_TOKEN = float(os.getenv("FAKE_GEMINI_FIRST_TOKEN", 0.5))
+FAKE_GEMINI_TOKENS_PER_SECOND = float(os.getenv("FAKE_GEMINI_TOKENS_PER_SECOND", 200))
+
+# Columns stored outside the JSON payload so filters and ordering can use the index
+OWNER_COLUMNS = ('user_id', 'username')
+
+FOOD_ANSWER = json.dumps({
+    "food_items": ["Steamed rice", "Dal", "Green salad"],
+    "calories": 455,
+    "protein": 18,
+    "carbs": 84,
+    "fat": 5,
+    "balance_rating": "Good",
+    "suggestions": ["Add a portion of curd for more protein", "Swap white rice for brown rice"]
+})
+
+ADVICE_ANSWER = " ".join([
+    "## Diet\n- Build meals around vegetables, lentils and lean protein.\n- Keep refined carbs low.",
+    "\n## Exercise\n- Walk 30 minutes a day and add two strength sessions a week.",
+    "\n## Lifestyle\n- Sleep 7-8 hours and keep meal times regular.",
+    "\n## Stress\n- Try 10 minutes of breathing exercises daily."
+] * 4)
+
+
+class FakeQuery:
+    """The subset of the postgrest query builder that app.py uses."""
+
+    def __init__(self, client, table):
+        self.client = client
+        self.table = table
+        self.operation = 'select'
+        self.columns = '*'
+        self.values = None
+        self.filters = []
+        self.order_by = None
+        self.limit_count = None
+
+    def select(self, columns='*'):
+        self.operation, self.columns = 'select', columns
+        return self
+
+    def insert(self, rows):
+        self.operation, self.values = 'insert', rows if isinstance(rows, list) else [rows]
+        return self
+
+    def upsert(self, rows, on_conflict='', ignore_duplicates=False):
+        # Only the (user_id, logged_at) conflict target app.py uses is supported
+        self.operation, self.values = 'upsert', rows if isinstance(rows, list) else [rows]
+        self.ignore_duplicates = ignore_duplicates
+        return self
+
+    def update(self, values):
+        self.operation, self.values = 'update', values
+        return self
+
+    def eq(self, column, value):
+        self.filters.append((column, '=', value))
+        return self
+
+    def gt(self, column, value):
+        self.filters.append((column, '>', value))
+        return self
+
+    def order(self, column, desc=False):
+        self.order_by = (column, desc)
+        return self
+
+    def limit(self, count):
+        self.limit_count = count
+        return self
+
+    def execute(self):
+        time.sleep(self.client.latency)
+        if self.table in self.client.unreachable:
+            raise ConnectionError(f"{self.table} is unreachable")
+        return SimpleNamespace(data=getattr(self.client, f"_{self.operation}")(self))
+
+
+class FakeSupabase:
+    """SQLite-backed client with a fixed latency added to every ``execute``."""
+
+    # Tables whose calls fail, to simulate an outage; shared by every client in the process
+    unreachable = set()
+
+    def __init__(self, path=None, latency=None):
+        self.latency = FAKE_SUPABASE_LATENCY if latency is None else latency
+        self._conn = sqlite3.connect(path or FAKE_SUPABASE_DB, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS rows ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, table_name TEXT NOT NULL, owner TEXT, "
+                "logged_at TEXT, payload TEXT NOT NULL)"
+            )
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_rows_owner ON rows (table_name, owner, logged_at)")
+
+    def table(self, name):
+        return FakeQuery(self, name)
+
+    @staticmethod
+    def _column(name):
+        if name in OWNER_COLUMNS:
+            return "owner", []
+        if name in ('id', 'logged_at'):
+            return name, []
+        return "json_extract(payload, ?)", [f"$.{name}"]
+
+    def _where(self, query):
+        clauses, params = ["table_name = ?"], [query.table]
+        for column, operator, value in query.filters:
+            expression, expression_params = self._column(column)
+            clauses.append(f"{expression} {operator} ?")
+            params += expression_params + [value]
+        return " AND ".join(clauses), params
+
+    def _insert(self, query):
+        rows = [
+            (query.table, next((row[c] for c in OWNER_COLUMNS if c in row), None), row.get('logged_at'),
+             json.dumps(row, default=str))
+            for row in query.values
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO rows (table_name, owner, logged_at, payload) VALUES (?, ?, ?, ?)", rows
+            )
+        return query.values
+
+    def _upsert(self, query):
+        written = []
+        with self._lock:
+            for row in query.values:
+                owner = next((row[c] for c in OWNER_COLUMNS if c in row), None)
+                existing = self._conn.execute(
+                    "SELECT id FROM rows WHERE table_name = ? AND owner IS ? AND logged_at IS ?",
+                    (query.table, owner, row.get('logged_at'))
+                ).fetchone()
+                payload = json.dumps(row, default=str)
+                if existing is None:
+                    self._conn.execute(
+                        "INSERT INTO rows (table_name, owner, logged_at, payload) VALUES (?, ?, ?, ?)",
+                        (query.table, owner, row.get('logged_at'), payload)
+                    )
+                elif query.ignore_duplicates:
+                    continue
+                else:
+                    self._conn.execute("UPDATE rows SET payload = ? WHERE id = ?", (payload, existing[0]))
+                written.append(row)
+        return written
+
+    def _select(self, query):
+        where, params = self._where(query)
+        sql = f"SELECT id, payload FROM rows WHERE {where}"
+        if query.order_by:
+            expression, expression_params = self._column(query.order_by[0])
+            sql += f" ORDER BY {expression} {'DESC' if query.order_by[1] else 'ASC'}"
+            params += expression_params
+        if query.limit_count is not None:
+            sql += " LIMIT ?"
+            params.append(query.limit_count)
+        with self._lock:
+            payloads = self._conn.execute(sql, params).fetchall()
+        # Like a Supabase table, each row carries the identity assigned on insert
+        rows = [dict(json.loads(payload), id=row_id) for row_id, payload in payloads]
+        if query.columns != '*':
+            columns = [column.strip() for column in query.columns.split(",")]
+            rows = [{column: row.get(column) for column in columns} for row in rows]
+        return rows
+
+    def _update(self, query):
+        where, params = self._where(query)
+        with self._lock:
+            matches = self._conn.execute(f"SELECT id, payload FROM rows WHERE {where}", params).fetchall()
+            updated = []
+            for row_id, payload in matches:
+                row = dict(json.loads(payload), **query.values)
+                self._conn.execute("UPDATE rows SET payload = ? WHERE id = ?", (json.dumps(row), row_id))
+                updated.append(row)
+        return updated
+
+
+class FakeChunk:
+    def __init__(self, text, tokens=0):
+        self.text = text
+        self.parts = [text]
+        self.usage_metadata = SimpleNamespace(total_token_count=tokens)
+
+
+class FakeStream:
+    """Iterable of chunks paced at the configured token rate, like a streamed response."""
+
+    def __init__(self, text, first_token, tokens_per_second):
+        self.text = text
+        self.first_token = first_token
+        self.tokens_per_second = tokens_per_second
+        self.usage_metadata = SimpleNamespace(total_token_count=estimate_tokens(text))
+
+    def __iter__(self):
+        time.sleep(self.first_token)
+        words = self.text.split(" ")
+        for start in range(0, len(words), 8):
+            chunk = " ".join(words[start:start + 8]) + " "
+            time.sleep(estimate_tokens(chunk) / self.tokens_per_second)
+            yield FakeChunk(chunk)
+
+
+class FakeModel:
+    """Returns canned answers: a food analysis for image prompts, PCOD/health advice otherwise."""
+
+    def __init__(self, model_name=None, first_token=None, tokens_per_second=None):
+        self.model_name = model_name
+        self.first_token = FAKE_GEMINI_FIRST_TOKEN if first_token is None else first_token
+        self.tokens_per_second = FAKE_GEMINI_TOKENS_PER_SECOND if tokens_per_second is None else tokens_per_second
+
+    def generate_content(self, contents, stream=False, generation_config=None, request_options=None):
+        # Image analysis passes [prompt, image]; advice passes a plain prompt
+        text = FOOD_ANSWER if isinstance(contents, list) else ADVICE_ANSWER
+        if stream:
+            return FakeStream(text, self.first_token, self.tokens_per_second)
+        tokens = estimate_tokens(text)
+        time.sleep(self.first_token + tokens / self.tokens_per_second)
+        return FakeChunk(text, tokens)
+
+
+def estimate_tokens(text):
+    return max(1, len(text) // 4)
+
+
+def password_hash(password, iterations):
+    """Same format as app.hash_password, so seeded users can log in."""
+    salt = os.urandom(16).hex()
+    digest = hashlib.pbkdf2_hmac('sha256', password.encode(), bytes.fromhex(salt), iterations).hex()
+    return f"pbkdf2_sha256${iterations}${salt}${digest}"
+
+
+def seed(client, usernames, password, days, meals_per_day=3, kdf_iterations=1000, rng=None):
+    """Give each user an account and ``days`` of food, exercise and health history."""
+    rng = rng or random.Random(0)
+    foods = ["Dal, Steamed rice", "Idli, Sambar", "Oatmeal", "Chicken curry, Roti", "Green salad", "Poha"]
+    today = datetime.datetime.now().replace(hour=8, minute=0, second=0, microsecond=0)
+    for username in usernames:
+        client.table('users').insert({
+            'username': username,
+            'password_hash': password_hash(password, kdf_iterations),
+            'created_at': str(today - datetime.timedelta(days=days))
+        }).execute()
+        food_logs, health_logs, calorie_tracking = [], [], []
+        for day in range(days, 0, -1):
+            start = today - datetime.timedelta(days=day)
+            for meal in range(meals_per_day):
+                logged_at = start + datetime.timedelta(hours=4 * meal, seconds=rng.randrange(3600))
+                food_logs.append({
+                    'user_id': username, 'logged_at': str(logged_at), 'time': logged_at.strftime("%H:%M"),
+                    'food': rng.choice(foods), 'calories': rng.randrange(200, 700)
+                })
+            logged_at = start + datetime.timedelta(hours=13)
+            health_logs.append({
+                'user_id': username, 'logged_at': str(logged_at), 'date': logged_at.strftime("%Y-%m-%d %H:%M"),
+                'blood_pressure': rng.randrange(105, 140), 'sugar_level': rng.randrange(80, 130),
+                'cholesterol': rng.randrange(150, 240)
+            })
+            calorie_tracking.append({
+                'user_id': username, 'logged_at': str(start + datetime.timedelta(hours=20)),
+                'intake': sum(row['calories'] for row in food_logs[-meals_per_day:]),
+                'burned': rng.randrange(0, 400), 'goal': 1800
+            })
+        for table, rows in (('food_logs', food_logs), ('health_logs', health_logs),
+                            ('calorie_tracking', calorie_tracking)):
+            client.table(table).insert(rows).execute()
@@ -0,0 +1,260 @@
+"""Throughput and latency benchmark for app.py with local stand-ins for Supabase and Gemini.
+
+Seeds a SQLite-backed fake Supabase with years of history per user, then drives the
+auth flow and every page through Streamlit's AppTest from many concurrent simulated
+users. Run from the repository root:
+
+    python -m benchmarks.run --users 20 --iterations 3 --days 730
+
+Reports reruns per second, p50/p95/p99 latency per step and memory per session.
+``--outage`` takes the Supabase data tables down after login to check that pages keep
+rendering from the local store.
+``--max-p95-ms`` makes the run exit non-zero when any step is slower, for use as a
+pre-deploy gate.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+PASSWORD = "benchmark"
+DATA_TABLES = ("food_logs", "health_logs", "calorie_tracking")
+
+
+def configure_environment(workdir, args):
+    """Point app.py and the fakes at throwaway databases; must run before AppTest starts."""
+    os.environ.update({
+        "WELLHER_SUPABASE_FACTORY": "benchmarks.fakes:FakeSupabase",
+        "WELLHER_MODEL_FACTORY": "benchmarks.fakes:FakeModel",
+        "WELLHER_LOCAL_DB": os.path.join(workdir, "local.db"),
+        "FAKE_SUPABASE_DB": os.path.join(workdir, "supabase.db"),
+        "FAKE_SUPABASE_LATENCY": str(args.db_latency),
+        "FAKE_GEMINI_FIRST_TOKEN": str(args.first_token),
+        "FAKE_GEMINI_TOKENS_PER_SECOND": str(args.token_rate),
+        "AUTH_KDF_ITERATIONS": str(args.kdf_iterations)
+    })
+
+
+def share_test_runtime():
+    """Let AppTest sessions run from several threads at once.
+
+    Each AppTest run installs a process-wide mock Runtime and clears it when done, so one
+    session finishing mid-rerun of another breaks the other with "Runtime hasn't been
+    created!"; fall back to the last installed mock instead. The ``global.appTest`` option
+    is patched the same way, so it is set for the whole process. Sessions also compile
+    app.py concurrently, and ``ast.parse`` is not thread-safe on every Python 3.11
+    release, so compiles are serialized.
+    """
+    import ast
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    last = []
+    parse, parse_lock = ast.parse, threading.Lock()
+
+    def instance(cls):
+        if cls._instance is not None:
+            last[:] = [cls._instance]
+        elif not last:
+            raise RuntimeError("Runtime hasn't been created!")
+        return cls._instance or last[0]
+
+    def locked_parse(*args, **kwargs):
+        with parse_lock:
+            return parse(*args, **kwargs)
+
+    Runtime.instance = classmethod(instance)
+    Runtime.exists = classmethod(lambda cls: cls._instance is not None or bool(last))
+    ast.parse = locked_parse
+    config.set_option("global.appTest", True)
+
+
+def widget(widgets, label):
+    """The widget labelled ``label``; the error lists the labels on the page when it is missing."""
+    for w in widgets:
+        if w.label == label:
+            return w
+    raise LookupError(f"No widget labelled {label!r}; found {[w.label for w in widgets]}")
+
+
+class Session:
+    """One simulated user; each step is one or more reruns of the app timed together."""
+
+    def __init__(self, username, timeout):
+        from streamlit.testing.v1 import AppTest
+        self.username = username
+        self.app = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        self.timings = []
+        self.errors = 0
+
+    def step(self, name, action):
+        started = time.perf_counter()
+        action()
+        self.timings.append((name, time.perf_counter() - started))
+        if self.app.exception:
+            self.errors += 1
+
+    def wait_for_ai(self, poll=0.05):
+        """Rerun until no AI job on the page is still running (its Stop button is gone)."""
+        deadline = time.monotonic() + self.app.default_timeout
+        while any(button.label == "Stop" for button in self.app.button) and time.monotonic() < deadline:
+            time.sleep(poll)
+            self.app.run()
+
+    def navigate(self, page):
+        widget(self.app.sidebar.selectbox, "Menu").select(page).run()
+
+    def login(self):
+        self.step("auth_page", self.app.run)
+
+        def submit():
+            widget(self.app.text_input, "Username").input(self.username)
+            widget(self.app.text_input, "Password").input(PASSWORD)
+            widget(self.app.button, "Login").click().run()
+
+        self.step("login", submit)
+
+    def visit_pages(self):
+        self.step("health_dashboard", lambda: self.navigate("Health Dashboard"))
+        self.step("dashboard_rerun", self.app.run)
+        self.step("food_analysis", lambda: self.navigate("Food Analysis"))
+
+        def manual_entry():
+            widget(self.app.text_input, "Food Name").input("Dal").run()
+            widget(self.app.button, "Add to Daily Log").click().run()
+
+        self.step("manual_entry", manual_entry)
+        self.step("health_logs", lambda: self.navigate("Health Logs"))
+        self.step("save_health_log", lambda: widget(self.app.button, "Save Log").click().run())
+        self.step("pcod_assistant", lambda: self.navigate("PCOD Assistant"))
+
+        def pcod_advice():
+            widget(self.app.selectbox, "Have you been diagnosed with PCOD?").select("Yes")
+            widget(self.app.button, "Save Profile").click().run()
+            widget(self.app.button, "Get Personalized PCOD Advice").click().run()
+            self.wait_for_ai()
+
+        self.step("pcod_advice", pcod_advice)
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def log_in_user(index, args):
+    session = Session(f"bench-user-{index}", args.timeout)
+    session.login()
+    return session
+
+
+def tour_pages(session, args):
+    for _ in range(args.iterations):
+        session.visit_pages()
+    return session
+
+
+def measure_memory(args, usernames):
+    """Traced allocation growth per logged-in session sitting on the dashboard."""
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    sessions = []
+    for username in usernames:
+        session = Session(username, args.timeout)
+        session.login()
+        sessions.append(session)
+    used = tracemalloc.get_traced_memory()[0] - baseline
+    tracemalloc.stop()
+    return used / len(sessions)
+
+
+def report(sessions, wall, memory_per_session):
+    steps = {}
+    for session in sessions:
+        for name, seconds in session.timings:
+            steps.setdefault(name, []).append(seconds * 1000)
+    reruns = sum(len(values) for values in steps.values())
+    result = {
+        "steps_per_second": reruns / wall,
+        "errors": sum(session.errors for session in sessions),
+        "memory_per_session_bytes": memory_per_session,
+        "steps": {
+            name: {
+                "count": len(values),
+                "p50_ms": percentile(values, 0.5),
+                "p95_ms": percentile(values, 0.95),
+                "p99_ms": percentile(values, 0.99),
+                "mean_ms": statistics.fmean(values)
+            }
+            for name, values in steps.items()
+        }
+    }
+    print(f"{'step':<18}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for name, stats in result["steps"].items():
+        print(f"{name:<18}{stats['count']:>7}{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}")
+    print(f"\n{result['steps_per_second']:.1f} steps/s over {wall:.1f}s, {result['errors']} errors")
+    if memory_per_session is not None:
+        print(f"{memory_per_session / 1024:.0f} KiB traced per session")
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=10, help="concurrent simulated users")
+    parser.add_argument("--iterations", type=int, default=3, help="page tours per user after login")
+    parser.add_argument("--days", type=int, default=730, help="days of seeded history per user")
+    parser.add_argument("--meals-per-day", type=int, default=3)
+    parser.add_argument("--db-latency", type=float, default=0.02, help="seconds added to each Supabase call")
+    parser.add_argument("--first-token", type=float, default=0.5, help="seconds before Gemini's first chunk")
+    parser.add_argument("--token-rate", type=float, default=200, help="Gemini tokens per second")
+    parser.add_argument("--kdf-iterations", type=int, default=1000, help="password hash rounds for seeded users")
+    parser.add_argument("--memory-sessions", type=int, default=5, help="sessions to trace for memory; 0 skips")
+    parser.add_argument("--outage", action="store_true",
+                        help="make Supabase data tables unreachable after login; pages should keep working")
+    parser.add_argument("--timeout", type=float, default=120, help="seconds allowed per rerun")
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--max-p95-ms", type=float, help="fail when any step's p95 exceeds this")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        configure_environment(workdir, args)
+        share_test_runtime()
+        from benchmarks import fakes
+        usernames = [f"bench-user-{i}" for i in range(max(args.users, args.memory_sessions))]
+        # Seed without latency so setup time does not depend on --db-latency
+        fakes.seed(fakes.FakeSupabase(latency=0), usernames, PASSWORD, args.days,
+                   args.meals_per_day, args.kdf_iterations)
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.users) as pool:
+            sessions = list(pool.map(lambda i: log_in_user(i, args), range(args.users)))
+            if args.outage:
+                # Logins still reach the users table; every data table is down from here on
+                fakes.FakeSupabase.unreachable.update(DATA_TABLES)
+            sessions = list(pool.map(lambda session: tour_pages(session, args), sessions))
+        wall = time.perf_counter() - started
+        fakes.FakeSupabase.unreachable.clear()
+
+        memory = measure_memory(args, usernames[:args.memory_sessions]) if args.memory_sessions else None
+        result = report(sessions, wall, memory)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.max_p95_ms is not None:
+        slow = [name for name, stats in result["steps"].items() if stats["p95_ms"] > args.max_p95_ms]
+        if slow:
+            print(f"p95 above {args.max_p95_ms:g} ms: {', '.join(slow)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
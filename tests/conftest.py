@@ -0,0 +1,54 @@
+"""Import app.py in Streamlit's bare mode against the benchmark stand-ins.
+
+Settings are read when app.py is imported, so they are set here first. Background
+flushes and pulls are pushed far out so tests drive them explicitly.
+"""
+
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+WORKDIR = tempfile.mkdtemp(prefix="wellher-tests-")
+
+os.environ.update({
+    "WELLHER_SUPABASE_FACTORY": "benchmarks.fakes:FakeSupabase",
+    "WELLHER_MODEL_FACTORY": "benchmarks.fakes:FakeModel",
+    "WELLHER_LOCAL_DB": os.path.join(WORKDIR, "local.db"),
+    "FAKE_SUPABASE_DB": os.path.join(WORKDIR, "supabase.db"),
+    "FAKE_SUPABASE_LATENCY": "0",
+    "FAKE_GEMINI_FIRST_TOKEN": "0",
+    "FAKE_GEMINI_TOKENS_PER_SECOND": "1000000",
+    "AUTH_KDF_ITERATIONS": "1000",
+    "WRITE_BATCH_SIZE": "1000000",
+    "WRITE_FLUSH_INTERVAL": "3600",
+    "LOCAL_SYNC_INTERVAL": "3600",
+})
+# app.py reads style.css and nutrition_foods.csv relative to the working directory
+os.chdir(ROOT)
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(scope="session")
+def app():
+    import app as module
+    return module
+
+
+@pytest.fixture
+def local_db(app):
+    """The shared local database, emptied of journaled and synced rows."""
+    conn, lock = app.get_local_db()
+    with lock:
+        for (table,) in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'").fetchall():
+            if table in ('pending_writes', 'dead_writes', 'local_rows', 'sync_cursors'):
+                conn.execute(f"DELETE FROM {table}")
+    return conn, lock
+
+
+@pytest.fixture
+def remote(tmp_path):
+    from benchmarks.fakes import FakeSupabase
+    return FakeSupabase(path=str(tmp_path / "remote.db"), latency=0)
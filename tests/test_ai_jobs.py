@@ -0,0 +1,142 @@
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+from benchmarks.fakes import FakeChunk
+
+
+class AnswerModel:
+    """Model stand-in answering every image prompt with the next of ``answers``."""
+
+    def __init__(self, *answers):
+        self.answers = list(answers)
+        self.calls = 0
+
+    def generate_content(self, contents, **kwargs):
+        self.calls += 1
+        return FakeChunk(self.answers.pop(0), 10)
+
+
+class MemoryCache:
+    def __init__(self):
+        self.entries = {}
+
+    def get(self, key):
+        return self.entries.get(key)
+
+    def put(self, key, value):
+        self.entries[key] = value
+
+
+class MemoryIndex:
+    def __init__(self):
+        self.recorded = []
+
+    def record(self, analysis):
+        self.recorded.append(analysis)
+
+
+def resources(app, model=None):
+    return app.AIResources(model, app.Metrics(100), app.ParseMetrics(), MemoryCache(), MemoryCache(), MemoryIndex())
+
+
+@pytest.fixture
+def jobs(app):
+    return app.AIJobQueue(max_workers=2, per_user=2, result_ttl=60, resources=resources(app))
+
+
+def analyze(app, jobs, model, color):
+    jobs.resources.model = model
+    image = Image.new('RGB', (32, 32), color)
+    job = jobs.submit('u0', ('food_analysis', app.image_fingerprint(image)), app.run_food_analysis, image)
+    deadline = time.monotonic() + 5
+    while not job.finished and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return job
+
+
+COMPLETE = '{"food_items": ["rice"], "calories": 300, "protein": 8, "carbs": 60, "fat": 2, ' \
+           '"balance_rating": "Good", "suggestions": []}'
+
+
+def test_unreadable_answer_fails_the_job_and_is_not_reused(app, jobs):
+    model = AnswerModel('not json at all', COMPLETE)
+    first = analyze(app, jobs, model, 'red')
+    assert first.status == 'failed'
+    assert 'could not be read' in first.error
+    second = analyze(app, jobs, model, 'red')
+    assert second is not first
+    assert second.status == 'done'
+    assert second.result[0]['calories'] == 300
+
+
+def test_partial_answer_is_asked_again(app, jobs):
+    model = AnswerModel('{"food_items": ["rice"], "calories": 300}', COMPLETE)
+    first = analyze(app, jobs, model, 'blue')
+    assert first.status == 'done' and first.result[0]['partial']
+    second = analyze(app, jobs, model, 'blue')
+    assert second is not first
+    assert not second.result[0].get('partial')
+    # Complete answers are shared with later submissions
+    assert analyze(app, jobs, model, 'blue') is second
+    assert model.calls == 2
+
+
+def test_batch_photos_run_past_the_per_user_limit_up_to_the_batch_limit(app, monkeypatch):
+    jobs = app.AIJobQueue(max_workers=4, per_user=1, result_ttl=60,
+                          resources=resources(app, AnswerModel(*[COMPLETE] * 3)))
+    monkeypatch.setattr(app, 'get_ai_jobs', lambda: jobs)
+    monkeypatch.setattr(app, 'AI_BATCH_PER_USER', 2)
+    app.st.session_state.user_id = 'u0'
+    items = []
+    for i, color in enumerate(['black', 'white', 'gray']):
+        image = Image.new('RGB', (32, 32), color)
+        items.append({'name': f'm{i}', 'file_id': str(i), 'image': image, 'key': ('batch', color),
+                      'job': None, 'done': False, 'result': None, 'error': None})
+    batch = {'items': items, 'added': None}
+
+    app.advance_food_batch(batch)
+    # Not held to the per-user limit of one job, but to the batch limit of two
+    assert sum(1 for item in items if item['job']) >= 2
+    deadline = time.monotonic() + 5
+    while not app.advance_food_batch(batch) and time.monotonic() < deadline:
+        assert sum(1 for item in items if item['job'] and not jobs.get(item['job']).finished) <= 2
+        time.sleep(0.01)
+    assert all(item['result']['calories'] == 300 for item in items)
+
+
+def test_stop_only_cancels_a_shared_job_once_nobody_waits(app, jobs):
+    started, release = threading.Event(), threading.Event()
+
+    def body(job, ai):
+        started.set()
+        release.wait(5)
+        job.text = 'full answer'
+        return job.text
+
+    alice = jobs.submit('alice', ('pcod_advice', 'same'), body, subscriber='alice-session')
+    bob = jobs.submit('bob', ('pcod_advice', 'same'), body, subscriber='bob-session')
+    assert bob is alice
+    started.wait(5)
+    assert not jobs.cancel(bob.id, 'bob-session')
+    release.set()
+    deadline = time.monotonic() + 5
+    while not alice.finished and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert alice.status == 'done'
+    assert alice.text == 'full answer'
+
+
+def test_last_subscriber_stopping_cancels_the_job(app, jobs):
+    release = threading.Event()
+    job = jobs.submit('alice', ('pcod_advice', 'alone'), lambda job, ai: release.wait(5), subscriber='alice-session')
+    assert jobs.cancel(job.id, 'alice-session')
+    release.set()
+    deadline = time.monotonic() + 5
+    while not job.finished and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert job.status == 'cancelled'
+    # A cancelled job is not handed to the next submission
+    assert jobs.submit('bob', ('pcod_advice', 'alone'), lambda job, ai: None) is not job
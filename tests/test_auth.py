@@ -0,0 +1,71 @@
+import threading
+import time
+
+
+def service(app, remote, max_failures=5, max_tracked=100, max_hashes=4):
+    return app.AuthService(remote, max_failures, failure_window=60, max_tracked=max_tracked,
+                           max_hashes=max_hashes, hash_wait=5)
+
+
+def test_user_created_on_another_instance_can_log_in_at_once(app, remote):
+    here, elsewhere = service(app, remote), service(app, remote)
+    assert not here.verify('ada', 'secret')
+    assert elsewhere.create('ada', 'secret')
+    assert here.verify('ada', 'secret')
+    assert not here.create('ada', 'other')
+
+
+def test_unknown_usernames_still_derive_a_key(app, remote, monkeypatch):
+    auth = service(app, remote)
+    auth.create('ada', 'secret')
+    checked = []
+    real = app.check_password
+    monkeypatch.setattr(app, 'check_password', lambda password, stored: checked.append(stored) or real(password, stored))
+    assert not auth.verify('nobody', 'secret')
+    assert not auth.verify('ada', 'wrong')
+    assert len(checked) == 2
+    assert all(stored.startswith(app.PASSWORD_SCHEME + '$') for stored in checked)
+
+
+def test_repeated_failures_are_refused_without_hashing(app, remote, monkeypatch):
+    auth = service(app, remote, max_failures=2)
+    auth.create('ada', 'secret')
+    assert not auth.verify('ada', 'wrong')
+    assert not auth.verify('ada', 'wrong')
+
+    def refuse(*args):
+        raise AssertionError("password was hashed for a limited username")
+
+    monkeypatch.setattr(app, 'check_password', refuse)
+    assert not auth.verify('ada', 'secret')
+
+
+def test_password_spray_keeps_only_the_latest_usernames(app, remote):
+    auth = service(app, remote, max_failures=1, max_tracked=3)
+    for i in range(10):
+        assert not auth.verify(f"user{i}", 'guess')
+    assert list(auth._failures) == ['user7', 'user8', 'user9']
+    assert auth.limited('user9')
+    assert not auth.limited('user0')
+
+
+def test_key_derivations_are_capped(app, remote, monkeypatch):
+    auth = service(app, remote, max_hashes=2)
+    running, peak, lock = [0], [0], threading.Lock()
+
+    def slow_check(password, stored):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.05)
+        with lock:
+            running[0] -= 1
+        return False
+
+    monkeypatch.setattr(app, 'check_password', slow_check)
+    threads = [threading.Thread(target=auth.verify, args=(f"user{i}", 'guess')) for i in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert peak[0] == 2
@@ -0,0 +1,24 @@
+import numpy as np
+
+
+def test_lttb_keeps_endpoints_and_returns_threshold_increasing_indices(app):
+    rng = np.random.default_rng(0)
+    x = np.arange(1000, dtype=np.float64)
+    y = rng.normal(size=1000)
+    keep = app.lttb(x, y, 50)
+    assert len(keep) == 50
+    assert keep[0] == 0 and keep[-1] == 999
+    assert np.all(np.diff(keep) > 0)
+
+
+def test_lttb_keeps_spikes(app):
+    x = np.arange(500, dtype=np.float64)
+    y = np.zeros(500)
+    y[123] = 50
+    assert 123 in app.lttb(x, y, 20)
+
+
+def test_lttb_returns_short_series_whole(app):
+    x = np.arange(10, dtype=np.float64)
+    assert list(app.lttb(x, x, 20)) == list(range(10))
+    assert list(app.lttb(x, x, 2)) == list(range(10))
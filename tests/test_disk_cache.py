@@ -0,0 +1,41 @@
+import uuid
+
+import pytest
+
+
+@pytest.fixture
+def clock(app, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(app.time, 'time', lambda: now[0])
+    return now
+
+
+def cache(app, ttl=60, max_entries=10):
+    # A fresh namespace keeps entries and counters from other tests out
+    return app.DiskCache(f"test-{uuid.uuid4().hex}", ttl, max_entries)
+
+
+def test_expired_entry_is_a_miss_and_removed(app, clock):
+    entries = cache(app, ttl=60)
+    entries.put('a', {'calories': 100})
+    clock[0] += 30
+    assert entries.get('a') == {'calories': 100}
+    clock[0] += 31
+    assert entries.get('a') is None
+    assert entries.stats() == {'hits': 1, 'misses': 1, 'entries': 0, 'hit_rate': 0.5}
+
+
+def test_least_recently_accessed_entry_is_evicted(app, clock):
+    entries = cache(app, max_entries=2)
+    entries.put('a', 1)
+    clock[0] += 1
+    entries.put('b', 2)
+    clock[0] += 1
+    # Reading 'a' makes 'b' the oldest accessed entry
+    assert entries.get('a') == 1
+    clock[0] += 1
+    entries.put('c', 3)
+    assert entries.get('b') is None
+    assert entries.get('a') == 1
+    assert entries.get('c') == 3
+    assert entries.stats()['entries'] == 2
@@ -0,0 +1,27 @@
+import datetime
+
+import pytest
+
+
+def store(app, days=200):
+    logs = app.HealthLogStore()
+    start = datetime.date(2026, 1, 1)
+    for i in range(days):
+        # Every tenth day runs high so episodes show up
+        high = i % 10 == 0
+        logs.append(str(start + datetime.timedelta(days=i)), 150 if high else 118, 100 + i % 7, 180 + i % 13)
+    return logs
+
+
+@pytest.mark.parametrize('budget', [600, 200, 120, 50, 10, 0])
+def test_build_stays_within_budget(app, budget):
+    text = app.HealthContextBuilder(store(app)).build(budget)
+    assert app.estimate_tokens(text) <= budget
+
+
+def test_larger_budgets_keep_more_detail(app):
+    builder = app.HealthContextBuilder(store(app))
+    full, small = builder.build(600), builder.build(120)
+    assert 'above limit' in full and 'Last 14 readings' in full
+    assert small.startswith('200 readings from 2026-01-01')
+    assert len(small) < len(full)
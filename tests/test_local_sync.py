@@ -0,0 +1,132 @@
+import pytest
+
+from benchmarks.fakes import FakeSupabase
+
+
+def meal(minute, user='u0', **extra):
+    return dict({'user_id': user, 'logged_at': f"2026-01-01 08:{minute:02d}:00", 'time': '08:00',
+                 'food': f"meal {minute}", 'calories': minute}, **extra)
+
+
+@pytest.fixture
+def sync(app, local_db, remote):
+    return app.LocalSync(app.LocalStore(), remote, app.get_read_cache(), app.get_rollups(), app.Metrics(100),
+                         interval=3600, idle=3600, overlap=100)
+
+
+@pytest.fixture
+def outage(monkeypatch):
+    monkeypatch.setattr(FakeSupabase, 'unreachable', set())
+    return FakeSupabase.unreachable
+
+
+def dirty_keys(local_db):
+    conn, lock = local_db
+    with lock:
+        return [key for (key,) in conn.execute("SELECT logged_at FROM local_rows WHERE dirty = 1 ORDER BY logged_at")]
+
+
+def test_outage_writes_are_kept_locally_and_pushed_on_reconnect(app, local_db, remote, sync, outage):
+    queue = app.WriteBehindQueue(remote, 1000000, 3600, sync.store.mark_clean)
+    outage.add('food_logs')
+    written = [meal(1), meal(2)]
+    sync.store.put('food_logs', 'u0', written)
+    queue.enqueue('food_logs', written)
+    queue.flush()
+    with pytest.raises(ConnectionError):
+        sync.pull('u0', 'food_logs')
+    assert [row['food'] for row in sync.store.rows('food_logs', 'u0')] == ['meal 1', 'meal 2']
+    assert len(dirty_keys(local_db)) == 2
+
+    outage.clear()
+    conn, lock = local_db
+    with lock:
+        conn.execute("UPDATE pending_writes SET retry_at = 0")
+    queue.flush()
+    assert sorted(row['food'] for row in remote.table('food_logs').select('*').execute().data) == ['meal 1', 'meal 2']
+    assert dirty_keys(local_db) == []
+    # The pushed rows come back on the next pull without being reported as new
+    assert sync.pull('u0', 'food_logs') == []
+    assert len(sync.store.rows('food_logs', 'u0')) == 2
+
+
+def test_late_rows_with_an_older_logged_at_are_pulled(sync, remote):
+    remote.table('food_logs').insert([meal(10), meal(20)]).execute()
+    assert [row['food'] for row in sync.pull('u0', 'food_logs')] == ['meal 10', 'meal 20']
+
+    # Another device comes back online and uploads an entry logged before the newest one
+    remote.table('food_logs').insert(meal(15)).execute()
+    fresh = sync.pull('u0', 'food_logs')
+    assert [row['food'] for row in fresh] == ['meal 15']
+    assert 'id' not in fresh[0]
+    assert [row['food'] for row in sync.store.rows('food_logs', 'u0')] == ['meal 10', 'meal 15', 'meal 20']
+    assert sync.pull('u0', 'food_logs') == []
+
+
+def test_failed_first_pull_is_left_to_the_background_sync(app, sync, remote, outage, monkeypatch):
+    selects = []
+    table = remote.table
+
+    def counted(name):
+        selects.append(name)
+        return table(name)
+
+    monkeypatch.setattr(remote, 'table', counted)
+    monkeypatch.setattr(app, 'get_local_sync', lambda: sync)
+    monkeypatch.setattr(app, 'get_local_store', lambda: sync.store)
+    app.st.session_state.user_id = 'late'
+    remote.table('food_logs').insert(meal(5, user='late')).execute()
+    selects.clear()
+
+    outage.add('food_logs')
+    for _ in range(3):
+        app.get_read_cache().invalidate('late')
+        assert app.load_user_data('food_logs') == []
+    assert selects == ['food_logs']
+
+    outage.clear()
+    sync.sync()
+    app.get_read_cache().invalidate('late')
+    assert [row['food'] for row in app.load_user_data('food_logs')] == ['meal 5']
+
+
+def test_late_rows_are_patched_into_the_cache_in_order(app, sync, remote):
+    cache = app.get_read_cache()
+    remote.table('food_logs').insert([meal(10), meal(20)]).execute()
+    sync.pull('u0', 'food_logs')
+    cache.put('u0', 'food_logs', sync.store.rows('food_logs', 'u0'))
+
+    remote.table('food_logs').insert(meal(15)).execute()
+    sync.watch('u0', 'food_logs')
+    sync.sync()
+    assert [row['food'] for row in cache.get('u0', 'food_logs')] == ['meal 10', 'meal 15', 'meal 20']
+    cache.invalidate('u0')
+
+
+def test_pushed_rows_returned_with_a_utc_offset_are_not_stored_twice(app, local_db, sync, remote):
+    written = meal(30)
+    sync.store.put('food_logs', 'u0', [written])
+    sync.store.mark_clean('food_logs', [written])
+    # A timestamptz column hands the pushed row back in ISO form with an offset
+    remote.table('food_logs').insert(dict(written, logged_at="2026-01-01T08:30:00+00:00")).execute()
+    assert sync.pull('u0', 'food_logs') == []
+    assert [row['food'] for row in sync.store.rows('food_logs', 'u0')] == ['meal 30']
+
+
+def test_frame_is_rebuilt_when_a_late_row_lands_in_the_middle(app, sync, remote, monkeypatch):
+    monkeypatch.setattr(app, 'get_local_sync', lambda: sync)
+    monkeypatch.setattr(app, 'get_local_store', lambda: sync.store)
+    app.st.session_state.user_id = 'u0'
+    app.st.session_state.frames = {}
+    cache = app.get_read_cache()
+    cache.invalidate('u0')
+    remote.table('food_logs').insert([meal(10), meal(20)]).execute()
+    assert list(app.load_user_frame('food_logs')['food']) == ['meal 10', 'meal 20']
+
+    remote.table('food_logs').insert(meal(15)).execute()
+    sync.sync()
+    assert list(app.load_user_frame('food_logs')['food']) == ['meal 10', 'meal 15', 'meal 20']
+    sync.store.put('food_logs', 'u0', [meal(25)])
+    cache.patch('u0', 'food_logs', [meal(25)])
+    assert list(app.load_user_frame('food_logs')['food']) == ['meal 10', 'meal 15', 'meal 20', 'meal 25']
+    cache.invalidate('u0')
@@ -0,0 +1,63 @@
+import pytest
+
+TABLE = """name,serving,calories,protein,carbs,fat
+Chicken breast,100 g,165,31,0,3.6
+Chicken curry,1 cup,240,20,8,14
+Fish curry,1 cup,220,22,6,12
+Dal,1 cup,180,12,30,1
+"""
+
+
+@pytest.fixture
+def index(app, tmp_path):
+    conn, lock = app.get_local_db()
+    with lock:
+        conn.execute("DROP TABLE IF EXISTS nutrition_history")
+    path = tmp_path / "foods.csv"
+    path.write_text(TABLE)
+    return app.NutritionIndex(str(path), min_samples=2)
+
+
+def analysis(items, calories):
+    return {'food_items': items, 'calories': calories, 'protein': 10, 'carbs': 20, 'fat': 5,
+            'balance_rating': 'Good', 'suggestions': []}
+
+
+def names(entries):
+    return [entry['name'] for entry in entries]
+
+
+def test_prefix_word_and_fuzzy_matches(index):
+    assert names(index.search('Chick')) == ['Chicken breast', 'Chicken curry']
+    assert names(index.search('curry')) == ['Chicken curry', 'Fish curry']
+    assert names(index.search('chiken curry')) == ['Chicken curry']
+    # A misspelled word inside a name is matched through the word index
+    assert names(index.search('cury')) == ['Chicken curry', 'Fish curry']
+    assert index.search('  ') == []
+
+
+def test_history_replaces_the_bundled_entry_after_min_samples(index):
+    index.record(analysis(['Dal'], 200))
+    assert index.match('dal')['source'] == 'bundled'
+    index.record(analysis(['Dal'], 300))
+    entry = index.match('DAL')
+    assert entry['source'] == 'history'
+    assert entry['calories'] == 250
+    assert entry['samples'] == 2
+
+
+def test_new_meals_are_only_matched_once_sampled_enough(app, index, tmp_path):
+    index.record(analysis(['rice', 'Dal'], 400))
+    assert index.match('Dal, rice') is None
+    assert names(index.search('dal')) == ['Dal', 'Dal, rice']
+    index.record(analysis(['Dal', 'rice'], 500))
+    assert index.match('dal rice')['calories'] == 450
+    # History survives a restart through the local database
+    reloaded = app.NutritionIndex(str(tmp_path / "foods.csv"), min_samples=2)
+    assert reloaded.match('dal rice')['calories'] == 450
+
+
+def test_analysis_from_an_index_entry_has_whole_calories(app, index):
+    result = app.nutrition_analysis(index.match('Chicken breast'))
+    assert result['calories'] == 165 and isinstance(result['calories'], int)
+    assert result['fat'] == 3.6
@@ -0,0 +1,71 @@
+import pytest
+
+
+@pytest.mark.parametrize('raw, expected', [
+    (450, 450),
+    (12.5, 12.5),
+    ('450 kcal', 450),
+    ('~30g', 30),
+    ('1,200 kcal', 1200),
+    ('12,345.5', 12345.5),
+    ('1.5e3', 1500),
+    ('400-500', 450),
+    ('400 to 500 kcal', 450),
+    ('about 450 kcal, 30g protein', 450),
+    ('0', 0),
+])
+def test_to_number_reads_model_amounts(app, raw, expected):
+    assert app.to_number(raw) == expected
+
+
+@pytest.mark.parametrize('raw', [None, True, '', 'unknown', '-50', -50, '−50 kcal', float('inf'), '1e999'])
+def test_to_number_rejects_missing_and_negative_amounts(app, raw):
+    assert app.to_number(raw) is None
+
+
+def test_complete_answer_parses_cleanly(app):
+    analysis, partial = app.parse_food_analysis(
+        '```json\n{"food_items": ["rice", "dal"], "calories": "1,200 kcal", "protein": "30g", '
+        '"carbs": "150-170", "fat": 20, "balance_rating": "good", "suggestions": ["add greens"]}\n```'
+    )
+    assert not partial
+    assert analysis == {
+        'food_items': ['rice', 'dal'], 'calories': 1200, 'protein': 30, 'carbs': 160, 'fat': 20,
+        'balance_rating': 'Good', 'suggestions': ['add greens'],
+    }
+
+
+def test_truncated_answer_keeps_what_was_read(app):
+    analysis, partial = app.parse_food_analysis('{"food_items": ["rice"], "calories": 300, "protein": 8, "car')
+    assert partial
+    assert analysis['calories'] == 300
+    assert analysis['carbs'] == 0
+
+
+@pytest.mark.parametrize('text', [
+    '{"food_items": [], "calories": 300}',
+    '{"food_items": "", "calories": 300}',
+    '{"food_items": ["rice"], "calories": "-300"}',
+    'no food here',
+])
+def test_answers_without_food_or_calories_are_rejected(app, text):
+    assert app.parse_food_analysis(text) == (None, True)
+
+
+def test_valid_answer_decodes_unicode_escapes(app):
+    analysis, partial = app.parse_food_analysis(
+        '{"food_items": ["Cr\\u00e8me br\\u00fbl\\u00e9e"], "calories": 350, "protein": 5, "carbs": 40, '
+        '"fat": 18, "balance_rating": "Average", "suggestions": ["Line one\\r\\nline two"]}'
+    )
+    assert not partial
+    assert analysis['food_items'] == ['Crème brûlée']
+    assert analysis['suggestions'] == ['Line one\r\nline two']
+
+
+def test_lenient_fallback_decodes_escapes(app):
+    analysis, partial = app.parse_food_analysis(
+        "{'food_items': ['Cr\\u00e8me br\\u00fbl\\u00e9e', \"Tab\\there\"], 'calories': 350, 'suggestions': ['a\\rb"
+    )
+    assert partial
+    assert analysis['food_items'] == ['Crème brûlée', 'Tab\there']
+    assert analysis['suggestions'] == ['a\rb']
@@ -0,0 +1,49 @@
+def food(day, calories, second=0):
+    return {'date': day, 'logged_at': f'{day}T08:00:{second:02d}', 'calories': calories}
+
+
+def test_recorded_rows_are_not_counted_again_by_sync(app):
+    rollups = app.Rollups(ttl=60, max_states=10)
+    rows = [food('2026-01-01', 100), food('2026-01-02', 200)]
+    rollups.sync('u', 'food_logs', rows)
+    written = [food('2026-01-03', 50)]
+    rollups.record('u', 'food_logs', written)
+    rollups.sync('u', 'food_logs', rows + written)
+    assert rollups.total('u', 'food_logs') == 350
+    assert rollups.count('u', 'food_logs') == 3
+    assert not rollups._states[('u', 'food_logs')]['recorded']
+
+
+def test_refetched_rows_with_a_late_insert_are_folded_from_scratch(app):
+    rollups = app.Rollups(ttl=60, max_states=10)
+    rows = [food('2026-01-01', 100), food('2026-01-03', 300)]
+    rollups.sync('u', 'food_logs', rows)
+    rollups.sync('u', 'food_logs', [rows[0], food('2026-01-02', 200), rows[1]])
+    assert rollups.total('u', 'food_logs') == 600
+    assert rollups.count('u', 'food_logs') == 3
+
+
+def test_states_expire_and_are_evicted(app, monkeypatch):
+    rollups = app.Rollups(ttl=60, max_states=2)
+    for user in ('a', 'b', 'c'):
+        rollups.sync(user, 'food_logs', [food('2026-01-01', 100)])
+    assert list(rollups._states) == [('b', 'food_logs'), ('c', 'food_logs')]
+
+    now = app.time.monotonic()
+    monkeypatch.setattr(app.time, 'monotonic', lambda: now + 61)
+    assert rollups.total('c', 'food_logs') == 0
+    assert ('c', 'food_logs') not in rollups._states
+
+
+def test_rows_reread_in_iso_form_are_not_folded_again(app):
+    rollups = app.Rollups(ttl=60, max_states=10)
+    first = {'date': '2026-01-01', 'logged_at': '2026-01-01 08:00:00.123456', 'calories': 100}
+    rollups.sync('u', 'food_logs', [first])
+    written = {'date': '2026-01-02', 'logged_at': '2026-01-02 08:00:00.123456', 'calories': 50}
+    rollups.record('u', 'food_logs', [written])
+    # After the push and pull the rows come back as Supabase writes timestamps
+    reread = [dict(first, logged_at='2026-01-01T08:00:00.123456+00:00'),
+              dict(written, logged_at='2026-01-02T08:00:00.123456')]
+    rollups.sync('u', 'food_logs', reread)
+    assert rollups.total('u', 'food_logs') == 150
+    assert rollups.count('u', 'food_logs') == 2
@@ -0,0 +1,67 @@
+import csv
+import io
+
+import pyarrow.parquet as pq
+import pytest
+
+
+@pytest.fixture
+def deferred_calls(monkeypatch):
+    """Callables handed to ``st.download_button``, with the media file manager that holds them."""
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    calls = []
+    add_deferred = MediaFileManager.add_deferred
+
+    def record(self, data_callable, *args, **kwargs):
+        file_id = add_deferred(self, data_callable, *args, **kwargs)
+        calls.append((self, file_id, data_callable))
+        return file_id
+
+    monkeypatch.setattr(MediaFileManager, 'add_deferred', record)
+    return calls
+
+
+def test_download_button_serves_the_export(local_db, deferred_calls):
+    from benchmarks import fakes
+    from benchmarks.run import Session, widget
+    fakes.seed(fakes.FakeSupabase(latency=0), ['exporter'], 'secret', 3)
+    session = Session('exporter', 60)
+    session.app.run()
+    widget(session.app.text_input, 'Username').input('exporter')
+    widget(session.app.text_input, 'Password').input('secret')
+    widget(session.app.button, 'Login').click().run()
+    deferred_calls.clear()
+    session.navigate('Import & Export')
+    assert not session.app.exception
+
+    # What Streamlit does on click; it rejects callables returning unsupported types
+    manager, file_id, data_callable = deferred_calls[-1]
+    assert manager.execute_deferred(file_id)
+    rows = list(csv.DictReader(io.StringIO(data_callable().decode())))
+    assert rows and rows[0].keys() >= {'logged_at', 'food', 'calories'}
+
+
+@pytest.mark.parametrize('fmt', ['csv', 'parquet'])
+def test_export_returns_bytes_in_pages(app, local_db, fmt):
+    rows = [{'user_id': 'u0', 'logged_at': f'2026-01-01 08:00:{i:02d}', 'date': '2026-01-01',
+             'food': f'meal {i}', 'calories': i} for i in range(25)]
+    app.get_local_store().put('food_logs', 'u0', rows)
+    data = app.export_user_rows('food_logs', 'u0', fmt, page_size=10)
+    assert isinstance(data, bytes)
+    if fmt == 'csv':
+        exported = list(csv.DictReader(io.StringIO(data.decode())))
+        assert [row['food'] for row in exported] == [row['food'] for row in rows]
+    else:
+        assert pq.read_table(io.BytesIO(data)).column('calories').to_pylist() == list(range(25))
+
+
+def test_non_finite_and_negative_amounts_are_rejected(app):
+    import pandas as pd
+    frame = pd.DataFrame({
+        'logged_at': ['2026-01-01 08:00', '2026-01-01 09:00', '2026-01-01 10:00', '2026-01-01 11:00', '2026-01-01 12:00'],
+        'food': ['rice', 'dal', 'roti', 'curd', 'tea'],
+        'calories': ['300', 'inf', '-50', 'nan', 'lots'],
+    }, dtype=str)
+    rows, rejected = app.validate_transfer_chunk('food_logs', frame)
+    assert [row['food'] for row in rows] == ['rice']
+    assert rejected == 4
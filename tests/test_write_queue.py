@@ -0,0 +1,80 @@
+class RejectingClient:
+    """Passes calls through to the fake, failing upserts that match ``reject``.
+
+    With ``commit_first`` the rows are written before the error, like a response
+    lost after the server committed.
+    """
+
+    def __init__(self, remote, reject, commit_first=False):
+        self.remote = remote
+        self.reject = reject
+        self.commit_first = commit_first
+
+    def table(self, name):
+        query = self.remote.table(name)
+        execute = query.execute
+
+        def checked():
+            if query.operation == 'upsert' and self.reject(query.values):
+                if self.commit_first:
+                    execute()
+                raise ConnectionError("upsert rejected")
+            return execute()
+
+        query.execute = checked
+        return query
+
+
+def rows(count, **extra):
+    return [dict({'user_id': 'u0', 'logged_at': f"2024-01-01 08:00:{i:02d}", 'calories': i}, **extra)
+            for i in range(count)]
+
+
+def remote_rows(remote):
+    return remote.table('food_logs').select('*').eq('user_id', 'u0').execute().data
+
+
+def retry_now(local_db):
+    conn, lock = local_db
+    with lock:
+        conn.execute("UPDATE pending_writes SET retry_at = 0")
+
+
+def test_flush_sends_journal_in_bounded_batches(app, local_db, remote, monkeypatch):
+    monkeypatch.setattr(app, 'WRITE_MAX_BULK', 4)
+    queue = app.WriteBehindQueue(remote, 1000000, 3600)
+    queue.enqueue('food_logs', rows(10))
+    assert queue._pending == 10
+    queue.flush()
+    assert len(remote_rows(remote)) == 10
+    assert queue._pending == 0
+
+
+def test_rejected_row_is_isolated_and_dead_lettered(app, local_db, remote, monkeypatch):
+    monkeypatch.setattr(app, 'WRITE_MAX_ATTEMPTS', 5)
+    flushed = []
+    client = RejectingClient(remote, lambda values: any(row.get('poison') for row in values))
+    queue = app.WriteBehindQueue(client, 1000000, 3600, lambda table, sent: flushed.extend(sent))
+    batch = rows(10)
+    batch[4]['poison'] = True
+    queue.enqueue('food_logs', batch)
+    for _ in range(app.WRITE_MAX_ATTEMPTS):
+        queue.flush()
+        retry_now(local_db)
+    assert sorted(row['calories'] for row in remote_rows(remote)) == [0, 1, 2, 3, 5, 6, 7, 8, 9]
+    assert len(flushed) == 9
+    assert queue.dead_letters() == 1
+    assert queue.pending('food_logs', 'u0') == []
+
+
+def test_resend_after_lost_response_does_not_duplicate(app, local_db, remote):
+    client = RejectingClient(remote, lambda values: True, commit_first=True)
+    queue = app.WriteBehindQueue(client, 1000000, 3600)
+    queue.enqueue('food_logs', rows(3))
+    queue.flush()
+    assert len(queue.pending('food_logs', 'u0')) == 3
+    client.reject = lambda values: False
+    retry_now(local_db)
+    queue.flush()
+    assert len(remote_rows(remote)) == 3
+    assert queue.pending('food_logs', 'u0') == []